@@ -35,10 +35,10 @@ const app = Vue.createApp({
       const { eventID, eventDateTime } = this.getQueryParams();
       const encodedDateTime = encodeURIComponent(eventDateTime);
       try {
-        const res = await fetch(`http://localhost:8000/seats/${eventID}/${encodedDateTime}`);
+        const res = await fetch(`http://localhost:8000/seatmap/${eventID}/${encodedDateTime}`);
         const data = await res.json();
         if (data.code === 200) {
-          this.seats = data.data;
+          this.seats = this.expandSeatMap(data.data);
           this.categorizeSeats();
         } else {
           console.error('Failed to fetch seats:', data.message);
@@ -49,6 +49,31 @@ const app = Vue.createApp({
         this.loading = false;
       }
     },
+    expandSeatMap(seatMap) {
+      // Turn the compact (run-length encoded) seat map back into one object per seat
+      const statuses = [];
+      for (let i = 0; i < seatMap.status.length; i += 2) {
+        const code = seatMap.status[i];
+        for (let n = 0; n < seatMap.status[i + 1]; n++) {
+          statuses.push(code === null ? null : seatMap.statusCodes[code]);
+        }
+      }
+
+      const seats = [];
+      for (const entry of seatMap.categories) {
+        for (const [start, end] of entry.ranges) {
+          for (let seatNo = start; seatNo <= end; seatNo++) {
+            seats.push({
+              seatNo: seatNo,
+              category: entry.category,
+              price: entry.price,
+              status: statuses[seatNo - seatMap.firstSeatNo]
+            });
+          }
+        }
+      }
+      return seats.sort((a, b) => a.seatNo - b.seatNo);
+    },
     categorizeSeats() {
       this.seatsByCategory = { A: [], B: [], C: [] };
       this.categoryFull = { A: true, B: true, C: true };
@@ -21,11 +21,11 @@ async function fetchEvents(retries = 3, delayMs = 500) {
             console.log("Events fetched successfully:", data.data.events);
             // Transform the data to match the format expected by the frontend
             return data.data.events.map(event => {
-                // Check both possible field names
+                // Images are served by the event service; fall back to inline data if sent
                 const rawImageData = event.imageBase64 || event.displayPicture || '';
-                
-                // Properly format the image data with prefix if needed
-                const imageData = rawImageData.startsWith('data:') ? 
+                const imageData = event.imageURL ?
+                                `http://localhost:8000${event.imageURL}` :
+                                rawImageData.startsWith('data:') ? 
                                 rawImageData : 
                                 rawImageData ? `data:image/png;base64,${rawImageData}` : '';
                 
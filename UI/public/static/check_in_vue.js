@@ -16,6 +16,7 @@ const app = Vue.createApp({
             qrStatusMessage: 'Initializing...',
             isCheckingScan: false, // Potentially redundant now, but can keep
             pollingIntervalId: null, // To store the polling timer
+            statusSource: null, // EventSource streaming the check-in status
             qrModalInstance: null // To store modal instance
         };
     },
@@ -189,12 +190,30 @@ const app = Vue.createApp({
             this.stopPollingStatus(); // Ensure no duplicate intervals
             console.log(`[Vue App] Starting status polling for ${this.selectedTicketId}`);
             this.isCheckingScan = true; // Indicate polling is active
+            if (window.EventSource) {
+                // The check-in service pushes the status as soon as the ticket is scanned
+                this.statusSource = new EventSource(`${checkInServiceBaseUrl}/checkstatus/${this.selectedTicketId}/stream`);
+                this.statusSource.addEventListener('status', event => {
+                    const data = JSON.parse(event.data);
+                    console.log(`[Vue App] Status event received: ${data.status}`);
+                    if (data.status === 'checked_in') {
+                        this.onCheckedIn();
+                    }
+                });
+                return;
+            }
             // Poll every 2 seconds (adjust as needed)
             this.pollingIntervalId = setInterval(this.checkScanStatus, 2000);
             // Optionally run immediate check
             // this.checkScanStatus(); 
         },
         stopPollingStatus() {
+            if (this.statusSource) {
+                console.log(`[Vue App] Closing status stream for ${this.selectedTicketId}`);
+                this.statusSource.close();
+                this.statusSource = null;
+                this.isCheckingScan = false;
+            }
             if (this.pollingIntervalId) {
                 console.log(`[Vue App] Stopping status polling for ${this.selectedTicketId}`);
                 clearInterval(this.pollingIntervalId);
@@ -221,23 +240,26 @@ const app = Vue.createApp({
                 console.log(`[Vue App] Poll status received: ${data.status}`);
 
                 if (data.status === 'checked_in') {
-                    console.log(`[Vue App] Ticket ${this.selectedTicketId} confirmed checked in! Redirecting...`);
-                    this.stopPollingStatus();
-                    if (this.qrModalInstance) {
-                         this.qrModalInstance.hide(); // Hide modal before redirect
-                    }
-                    
-                    // Redirect the main window to the success page
-                    window.location.href = `${checkInServiceBaseUrl}/success`; 
-                    
-                    // No need to reload tickets here as we are navigating away
-                    // await this.loadUserTickets(); 
+                    this.onCheckedIn();
                 }
                 // If status is 'not_yet', do nothing
 
             } catch (error) {
                 console.error('[Vue App] Error during status polling fetch:', error);
             }
+        },
+        onCheckedIn() {
+            console.log(`[Vue App] Ticket ${this.selectedTicketId} confirmed checked in! Redirecting...`);
+            this.stopPollingStatus();
+            if (this.qrModalInstance) {
+                 this.qrModalInstance.hide(); // Hide modal before redirect
+            }
+            
+            // Redirect the main window to the success page
+            window.location.href = `${checkInServiceBaseUrl}/success`; 
+            
+            // No need to reload tickets here as we are navigating away
+            // await this.loadUserTickets(); 
         }
     }
 });
@@ -0,0 +1,66 @@
+"""Micro-benchmark for the event date lookup behind GET /event/<eventID>/<eventDateTime>.
+
+Compares the lookup select_event_date used to do (load the Event, load and log every
+EventDate of the event at INFO, then query the requested date) with find_event_date,
+a single query on the (eventID, eventDateTime) index.
+
+Needs the same MONGO_* environment as event.py and an existing event date, e.g.:
+
+    python bench_select_event_date.py E001 2025-06-15T12:00:00 --calls 500 2>/dev/null
+
+(stderr is discarded so the terminal does not dominate the cost of the old INFO logging;
+the log records are still formatted and written.)
+"""
+import argparse
+import time
+from datetime import datetime
+
+# Importing the service connects to MongoDB the same way it does at startup
+from event import Event, EventDate, find_event_date, logger
+
+
+def legacy_lookup(eventID, search_datetime):
+    """The lookup path select_event_date used before find_event_date."""
+    event = Event.objects(eventID=eventID).first()
+    if not event:
+        return None
+
+    all_dates = EventDate.objects(eventID=eventID)
+    logger.info(f"Found {len(all_dates)} dates for event {eventID}")
+    for date in all_dates:
+        logger.info(f"Available date: {date.eventDateTime.isoformat() if date.eventDateTime else None}")
+
+    return EventDate.objects(eventID=eventID, eventDateTime=search_datetime).first()
+
+
+def ms_per_call(lookup, eventID, search_datetime, calls):
+    lookup(eventID, search_datetime)  # warm up the connection pool
+    start = time.perf_counter()
+    for _ in range(calls):
+        lookup(eventID, search_datetime)
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("eventID")
+    parser.add_argument("eventDateTime", help="ISO datetime of an existing event date")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    search_datetime = datetime.fromisoformat(args.eventDateTime.replace('Z', '+00:00'))
+    if not find_event_date(args.eventID, search_datetime):
+        parser.error(f"No event date found for eventID {args.eventID} on {args.eventDateTime}")
+
+    dates = EventDate.objects(eventID=args.eventID).count()
+    before = ms_per_call(legacy_lookup, args.eventID, search_datetime, args.calls)
+    after = ms_per_call(find_event_date, args.eventID, search_datetime, args.calls)
+
+    print(f"event {args.eventID} with {dates} dates, {args.calls} calls each")
+    print(f"before (legacy lookup):  {before:8.3f} ms/call")
+    print(f"after  (find_event_date): {after:8.3f} ms/call")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
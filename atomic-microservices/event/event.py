@@ -1,14 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import mongoengine as db
 from datetime import datetime
 import pytz
+from collections import defaultdict, OrderedDict
+import base64
+import hashlib
+import threading
+import time
+import functools
+import random
+from io import BytesIO
 from os import environ
 import os
 import urllib.parse
 import logging
 from dotenv import load_dotenv
 
+try:
+    from PIL import Image  # optional: only needed for thumbnails
+except ImportError:
+    Image = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -18,6 +31,23 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+SGT = pytz.timezone('Asia/Singapore')
+
+# Event images: widths thumbnails may be rendered at, and how many rendered images to keep
+IMAGE_WIDTHS = [int(width) for width in os.getenv("EVENT_IMAGE_WIDTHS", "160,320,640").split(",")]
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("EVENT_IMAGE_CACHE_MAX_ENTRIES", "128"))
+# How long a rendered image is served before it is re-read and re-hashed (events are written
+# straight to MongoDB, so this bounds how long a replaced image can go unnoticed)
+IMAGE_VERIFY_SECONDS = float(os.getenv("EVENT_IMAGE_VERIFY_SECONDS", "60"))
+
+# Serialized GET responses: how many to keep, and how long one may be served before it is
+# rebuilt (bounds staleness from writes made through other replicas of this service)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("EVENT_RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("EVENT_RESPONSE_CACHE_TTL_SECONDS", "5"))
+
+# Fraction of event date lookups logged when DEBUG logging is on
+LOOKUP_LOG_SAMPLE_RATE = float(os.getenv("EVENT_LOOKUP_LOG_SAMPLE_RATE", "0.01"))
+
 CORS(app)
 
 # MongoDB connection details from environment variables
@@ -45,9 +75,14 @@ class Event(db.Document): # tell flask what are the fields in your database
     venue = db.StringField(required=True)
     description = db.StringField()
     totalSeats = db.IntField(required=True)
+    imageHash = db.StringField()  # content hash of imageBase64, set by save() or lazily by the routes
 
     meta = {'collection': 'Event'} 
 
+    def save(self, *args, **kwargs):
+        self.imageHash = image_hash(self.imageBase64)
+        super().save(*args, **kwargs)
+
     def to_json(self):
         return {
             "eventID": self.eventID,
@@ -70,6 +105,7 @@ class EventDate(db.Document): # tell flask what are the fields in your database
         'collection': 'EventDate', 
         'indexes': [
             {'fields': ['event', 'eventDateID'], 'unique': True},
+            {'fields': ['eventID', 'eventDateTime']},
         ]
     }
 
@@ -86,6 +122,166 @@ class EventDate(db.Document): # tell flask what are the fields in your database
             self.eventID = self.event.eventID
         super().save(*args, **kwargs)
 
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+image_cache = LRUCache(IMAGE_CACHE_MAX_ENTRIES)
+response_cache = LRUCache(RESPONSE_CACHE_MAX_ENTRIES)
+
+# Bumped on every write made through this service; part of the response cache key
+event_versions = defaultdict(int)
+catalog_version = 0
+versions_lock = threading.Lock()
+
+def bump_event_version(eventID):
+    """Invalidate cached responses for one event and for the listing."""
+    global catalog_version
+    with versions_lock:
+        event_versions[eventID] += 1
+        catalog_version += 1
+
+def cached_json(version_for):
+    """Cache a GET route's 200 responses as serialized bytes, keyed on the request URL and
+       version_for(**route kwargs), and answer If-None-Match with 304 via a content ETag.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            key = (request.full_path, version_for(**kwargs))
+            entry = response_cache.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response  # errors are not cached
+                body = response.get_data()
+                entry = (time.monotonic() + RESPONSE_CACHE_TTL_SECONDS, body, hashlib.sha1(body).hexdigest())
+                response_cache.put(key, entry)
+
+            _, body, etag = entry
+            response = Response(body, mimetype="application/json")
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"  # browsers may keep it, but must revalidate
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+def image_hash(imageBase64):
+    """Short content hash identifying one version of an event image."""
+    if not imageBase64:
+        return None
+    return hashlib.sha256(imageBase64.encode()).hexdigest()[:16]
+
+def image_url(event):
+    """Versioned image URL, so browsers and CDNs can cache it forever."""
+    if not event.imageHash:
+        return None
+    return f"/event/{event.eventID}/image?v={event.imageHash}"
+
+def decode_image(imageBase64):
+    """Decode a stored image (plain base64 or a data: URI) into (bytes, mimetype)."""
+    mimetype = None
+    if imageBase64.startswith("data:"):
+        header, imageBase64 = imageBase64.split(",", 1)
+        mimetype = header[5:].split(";")[0] or None
+
+    data = base64.b64decode(imageBase64)
+    if not mimetype:
+        if data.startswith(b"\x89PNG"):
+            mimetype = "image/png"
+        elif data.startswith(b"\xff\xd8"):
+            mimetype = "image/jpeg"
+        elif data.startswith(b"GIF8"):
+            mimetype = "image/gif"
+        elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            mimetype = "image/webp"
+        else:
+            mimetype = "application/octet-stream"
+    return data, mimetype
+
+def render_thumbnail(data, width):
+    """Scale an image down to width, keeping its format. Returns None if Pillow is unavailable."""
+    if Image is None:
+        return None
+    with Image.open(BytesIO(data)) as img:
+        img_format = img.format
+        img.thumbnail((width, width * 10))
+        output = BytesIO()
+        img.save(output, format=img_format)
+    return output.getvalue()
+
+def store_image_hash(eventID, stored_hash, imageBase64):
+    """Hash an image read from MongoDB; if that differs from the stored imageHash (missing, or the
+       image was replaced outside this service), store the new one and invalidate cached responses."""
+    current_hash = image_hash(imageBase64)
+    if current_hash != stored_hash:
+        Event.objects(eventID=eventID).update(set__imageHash=current_hash)
+        bump_event_version(eventID)
+    return current_hash
+
+def ensure_image_hashes(events):
+    """Fill in imageHash for events stored without one, reading only their images."""
+    missing = {event.id: event for event in events if not event.imageHash}
+    if not missing:
+        return
+    for stored in Event.objects(id__in=list(missing), imageBase64__ne=None).only("id", "eventID", "imageBase64"):
+        missing[stored.id].imageHash = store_image_hash(stored.eventID, None, stored.imageBase64)
+
+def backfill_image_hashes():
+    """Set imageHash on events stored before it existed, so listings never load images to hash them."""
+    for event in Event.objects(imageHash=None, imageBase64__ne=None).only("id", "imageBase64"):
+        Event.objects(id=event.id).update(set__imageHash=image_hash(event.imageBase64))
+
+# Fields returned by the listing and detail routes unless ?fields= asks for others
+EVENT_FIELDS = ["eventID", "eventName", "imageURL", "imageHash", "venue", "description", "totalSeats", "dates"]
+EVENT_OPTIONAL_FIELDS = ["imageBase64"]
+
+def requested_fields():
+    """Read the ?fields= projection; imageBase64 is only sent when asked for explicitly."""
+    fields = request.args.get("fields")
+    if not fields:
+        return EVENT_FIELDS
+    return [field for field in fields.split(",") if field in EVENT_FIELDS + EVENT_OPTIONAL_FIELDS]
+
+def event_summary(event, dates, fields):
+    """Event as returned by the listing and detail routes, limited to fields."""
+    summary = {
+        "eventID": event.eventID,
+        "eventName": event.eventName,
+        "imageURL": image_url(event),
+        "imageHash": event.imageHash,
+        "venue": event.venue,
+        "description": event.description,
+        "totalSeats": event.totalSeats,
+        "dates": dates
+    }
+    if "imageBase64" in fields:
+        summary["imageBase64"] = event.imageBase64
+    return {field: summary[field] for field in fields}
+
+def load_events(query, fields):
+    """Apply the projection to an Event query so images are only read from MongoDB when requested."""
+    if "imageBase64" not in fields:
+        query = query.exclude("imageBase64")
+    return query
+
 # Verify database connection after class definitions
 try:
     if Event.objects.count() >= 0:
@@ -96,54 +292,101 @@ except Exception as e:
     logger.error(f"Failed to verify database connection: {e}")
     raise
 
+try:
+    backfill_image_hashes()
+except Exception as e:
+    logger.error(f"Failed to backfill event image hashes: {e}")
+
+def format_event_date(date):
+    """Format an EventDate row (document or raw dict) for the event listing, in SGT."""
+    sgt_time = date["eventDateTime"].replace(tzinfo=pytz.UTC).astimezone(SGT)
+    return {
+        "eventDateID": date.get("eventDateID"),
+        "eventDateTime": sgt_time.isoformat(),
+        "availableSeats": date.get("availableSeats") or 0,
+        "formattedDateTime": sgt_time.strftime("%d %B %Y at %I:%M %p SGT")
+    }
+
+def parse_listing_datetime(value):
+    """Parse a from/to query parameter; naive values are taken as SGT. Returns UTC-naive."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = SGT.localize(parsed)
+    return parsed.astimezone(pytz.UTC).replace(tzinfo=None)
+
+def find_event_date(eventID, search_datetime):
+    """Look up one EventDate with a single query on the (eventID, eventDateTime) index,
+       loading only the fields EventDate.to_json needs.
+    """
+    event_date = EventDate.objects(eventID=eventID, eventDateTime=search_datetime) \
+        .only("eventDateID", "eventDateTime", "availableSeats").first()
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOOKUP_LOG_SAMPLE_RATE:
+        logger.debug("event_date_lookup eventID=%s eventDateTime=%s found=%s",
+                     eventID, search_datetime.isoformat(), event_date is not None)
+    return event_date
+
 #Route 1
 @app.route("/event")
+@cached_json(lambda: catalog_version)
 def get_all_events():
+    '''List events with their dates.
+       query params (all optional): venue (substring match), from / to (ISO datetimes bounding
+       the event dates, naive values in SGT), page (1-based, default 1) and limit (page size,
+       default: no paging), fields (comma-separated fields to return, e.g. "eventID,imageBase64")
+    '''
     try:
-        events = Event.objects()  # Fetch all events
+        fields = requested_fields()
+        venue = request.args.get("venue")
+        page = request.args.get("page", 1, type=int)
+        limit = request.args.get("limit", type=int)
+        try:
+            date_from = parse_listing_datetime(request.args["from"]) if request.args.get("from") else None
+            date_to = parse_listing_datetime(request.args["to"]) if request.args.get("to") else None
+        except ValueError as e:
+            return jsonify({"code": 400, "message": f"Invalid datetime format: {e}"}), 400
+
+        if page < 1 or (limit is not None and limit < 1):
+            return jsonify({"code": 400, "message": "page and limit must be positive integers."}), 400
+
+        date_filter = {}
+        if date_from:
+            date_filter["eventDateTime__gte"] = date_from
+        if date_to:
+            date_filter["eventDateTime__lte"] = date_to
+
+        events = Event.objects()
+        if venue:
+            events = events.filter(venue__icontains=venue)
+        if date_filter:
+            # Only events with at least one date in range
+            events = events.filter(eventID__in=EventDate.objects(**date_filter).distinct("eventID"))
+
+        events = load_events(events, fields).order_by("id")  # insertion order, stable across pages
+        total = events.count() if limit else None
+        if limit:
+            events = events.skip((page - 1) * limit).limit(limit)
+        events = list(events)
+        ensure_image_hashes(events)
         logger.info(f"Found {len(events)} events")
 
         if events:
-            event_data = []
-            
-            for event in events:
-                logger.info(f"Processing Event: {event.eventID}, Name: {event.eventName}")
-
-                # Retrieve event dates by using the reference field
-                event_dates = EventDate.objects(eventID=event.eventID)  # Corrected query
-                
-                # Log the number of dates for this event
-                logger.info(f"Dates for {event.eventID}: {len(event_dates)}")
-                
-                # Process each event
-                event_info = {
-                    "eventID": event.eventID,
-                    "eventName": event.eventName,
-                    "imageBase64": event.imageBase64,
-                    "venue": event.venue,
-                    "description": event.description,
-                    "totalSeats": event.totalSeats,
-                    "dates": []
-                }
-                
-                # Add date information
-                for date in event_dates:
-                    sgt_time = date.eventDateTime.replace(tzinfo=pytz.UTC).astimezone(pytz.timezone('Asia/Singapore'))
-                    event_info["dates"].append({
-                        "eventDateID": date.eventDateID,
-                        "eventDateTime": sgt_time.isoformat(),
-                        "availableSeats": date.availableSeats or 0,
-                        "formattedDateTime": sgt_time.strftime("%d %B %Y at %I:%M %p SGT")
-                    })
-                
-                event_data.append(event_info)
-            
+            # One query for the dates of every event on this page, grouped in memory
+            dates_by_event = defaultdict(list)
+            event_dates = EventDate.objects(eventID__in=[event.eventID for event in events], **date_filter) \
+                .only("eventID", "eventDateID", "eventDateTime", "availableSeats").as_pymongo()
+            for date in event_dates:
+                dates_by_event[date["eventID"]].append(format_event_date(date))
+
+            event_data = [event_summary(event, dates_by_event[event.eventID], fields) for event in events]
+
+            data = {"events": event_data}
+            if limit:
+                data["pagination"] = {"page": page, "limit": limit, "total": total}
+
             return jsonify(
                 {
                     "code": 200,
-                    "data": {
-                        "events": event_data
-                    }
+                    "data": data
                 }
             )
         
@@ -165,12 +408,15 @@ def get_all_events():
 
 #Route 2
 @app.route("/event/<string:eventID>")
+@cached_json(lambda eventID: event_versions.get(eventID, 0))
 def select_event(eventID):
     try:
-        event = Event.objects(eventID=eventID).first()
+        fields = requested_fields()
+        event = load_events(Event.objects(eventID=eventID), fields).first()
 
         if not event:
             return jsonify({"code": 404, "message": "Event not found"}), 404
+        ensure_image_hashes([event])
         
         event_id = event.eventID
         event_dates = EventDate.objects(eventID=event_id)
@@ -178,15 +424,7 @@ def select_event(eventID):
         return jsonify(
             {
                 "code": 200,
-                "data": {
-                    "eventID": event.eventID,
-                    "eventName": event.eventName,
-                    "imageBase64": event.imageBase64,
-                    "venue": event.venue,
-                    "description": event.description,
-                    "totalSeats": event.totalSeats,
-                    "dates": [date.to_json() for date in event_dates]
-                }
+                "data": event_summary(event, [date.to_json() for date in event_dates], fields)
             }
         )
     except Exception as e:
@@ -195,25 +433,9 @@ def select_event(eventID):
 
 #Route 3
 @app.route("/event/<string:eventID>/<string:eventDateTime>")
+@cached_json(lambda eventID, eventDateTime: event_versions.get(eventID, 0))
 def select_event_date(eventID, eventDateTime):
     try:        
-        # Find the Event document
-        event = Event.objects(eventID=eventID).first()
-        if not event:
-            logger.warning(f"Event with eventID {eventID} not found")
-            return jsonify(
-                {
-                    "code": 404,
-                    "message": f"Event with eventID {eventID} not found."
-                }
-            ), 404
-
-        # Log all event dates for this event
-        all_dates = EventDate.objects(eventID=eventID)
-        logger.info(f"Found {len(all_dates)} dates for event {eventID}")
-        for date in all_dates:
-            logger.info(f"Available date: {date.eventDateTime.isoformat() if date.eventDateTime else None}")
-
         # Parse the input datetime string
         try:
             search_datetime = datetime.fromisoformat(eventDateTime.replace('Z', '+00:00'))
@@ -226,10 +448,20 @@ def select_event_date(eventID, eventDateTime):
                 }
             ), 400
 
-        # Find the specific EventDate
-        event_date = EventDate.objects(eventID=eventID, eventDateTime=search_datetime).first()
+        # Find the specific EventDate: one query on the (eventID, eventDateTime) index
+        event_date = find_event_date(eventID, search_datetime)
 
         if not event_date:
+            # Only the miss path pays for telling a missing event from a missing date
+            if not Event.objects(eventID=eventID).only("eventID").first():
+                logger.warning(f"Event with eventID {eventID} not found")
+                return jsonify(
+                    {
+                        "code": 404,
+                        "message": f"Event with eventID {eventID} not found."
+                    }
+                ), 404
+
             logger.warning(f"No event date found for eventID {eventID} on {search_datetime.isoformat()}")
             return jsonify(
                 {
@@ -322,6 +554,7 @@ def update_event(eventID, eventDateTime):
 
         try:
             event_date.save()
+            bump_event_version(eventID)
             logger.info(f"Successfully updated event date with new available seats: {data['availableSeats']}")
         except Exception as e:
             logger.error(f"Failed to save event date update: {e}")
@@ -347,6 +580,152 @@ def update_event(eventID, eventDateTime):
                 "message": f"Internal server error: {str(e)}"
             }
         ), 500
-    
+
+def adjust_available_seats(eventID, eventDateTime, delta):
+    """Atomically add delta to availableSeats of an event date in one round trip.
+       A negative delta (reservation) only applies if enough seats are left.
+       return: a (response, status) pair for the route
+    """
+    try:
+        search_datetime = datetime.fromisoformat(eventDateTime.replace('Z', '+00:00'))
+    except ValueError as e:
+        logger.error(f"Error parsing datetime: {e}")
+        return jsonify(
+            {
+                "code": 400,
+                "message": f"Invalid datetime format: {eventDateTime}"
+            }
+        ), 400
+
+    query = EventDate.objects(eventID=eventID, eventDateTime=search_datetime)
+    if delta < 0:
+        query = query.filter(availableSeats__gte=-delta)
+
+    # find_one_and_update: the check and the $inc happen in a single server-side operation
+    event_date = query.modify(new=True, inc__availableSeats=delta)
+
+    if not event_date:
+        existing = EventDate.objects(eventID=eventID, eventDateTime=search_datetime).only('availableSeats').first()
+        if not existing:
+            logger.warning(f"No event date found for eventID {eventID} on {search_datetime.isoformat()}")
+            return jsonify(
+                {
+                    "code": 404,
+                    "message": f"No event date found for eventID {eventID} on {eventDateTime}.",
+                }
+            ), 404
+
+        logger.warning(f"Cannot reserve {-delta} seats for {eventID} on {eventDateTime}, {existing.availableSeats} left")
+        return jsonify(
+            {
+                "code": 409,
+                "data": {"availableSeats": existing.availableSeats},
+                "message": f"Only {existing.availableSeats} seats left for this event date."
+            }
+        ), 409
+
+    bump_event_version(eventID)
+    logger.info(f"Adjusted available seats for {eventID} on {eventDateTime} by {delta}: {event_date.availableSeats} left")
+    return jsonify(
+        {
+            "code": 200,
+            "data": event_date.to_json()
+        }
+    ), 200
+
+def get_quantity():
+    """Read a positive integer "quantity" from the JSON body, None if invalid."""
+    data = request.get_json(silent=True) or {}
+    quantity = data.get("quantity", 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        return None
+    return quantity
+
+#Route 5
+@app.route("/event/<string:eventID>/<string:eventDateTime>/reserve", methods = ["POST"])
+def reserve_seats(eventID, eventDateTime):
+    '''Atomically take "quantity" seats off availableSeats, failing with 409 if not enough are left'''
+    try:
+        quantity = get_quantity()
+        if quantity is None:
+            return jsonify({"code": 400, "message": "quantity must be a positive integer."}), 400
+
+        return adjust_available_seats(eventID, eventDateTime, -quantity)
+    except Exception as e:
+        logger.error(f"Error in reserve_seats: {e}")
+        return jsonify(
+            {
+                "code": 500,
+                "message": f"Internal server error: {str(e)}"
+            }
+        ), 500
+
+#Route 6
+@app.route("/event/<string:eventID>/<string:eventDateTime>/release", methods = ["POST"])
+def release_seats(eventID, eventDateTime):
+    '''Atomically give "quantity" seats back to availableSeats, e.g. when a purchase fails after reserving'''
+    try:
+        quantity = get_quantity()
+        if quantity is None:
+            return jsonify({"code": 400, "message": "quantity must be a positive integer."}), 400
+
+        return adjust_available_seats(eventID, eventDateTime, quantity)
+    except Exception as e:
+        logger.error(f"Error in release_seats: {e}")
+        return jsonify(
+            {
+                "code": 500,
+                "message": f"Internal server error: {str(e)}"
+            }
+        ), 500
+
+#Route 7
+@app.route("/event/<string:eventID>/image")
+def get_event_image(eventID):
+    '''Event poster as binary, cacheable by browsers and CDNs.
+       query params: w (optional thumbnail width, one of IMAGE_WIDTHS), v (image hash from imageURL)
+    '''
+    try:
+        width = request.args.get("w", type=int)
+        if width is not None and width not in IMAGE_WIDTHS:
+            return jsonify({"code": 400, "message": f"w must be one of {IMAGE_WIDTHS}."}), 400
+
+        # Rendered images are cached with the hash of the content they were rendered from, so
+        # each variant is decoded/resized once; after IMAGE_VERIFY_SECONDS the stored image is
+        # re-read and re-hashed, which also fills in or corrects the event's imageHash
+        key = (eventID, width)
+        cached = image_cache.get(key)
+        if cached is None or cached[0] < time.monotonic():
+            stored = Event.objects(eventID=eventID).only("imageBase64", "imageHash").first()
+            if not stored or not stored.imageBase64:
+                return jsonify({"code": 404, "message": "Event image not found."}), 404
+            content_hash = store_image_hash(eventID, stored.imageHash, stored.imageBase64)
+            if cached is not None and cached[1] == content_hash:
+                data, mimetype = cached[2], cached[3]
+            else:
+                data, mimetype = decode_image(stored.imageBase64)
+                if width is not None:
+                    data = render_thumbnail(data, width) or data
+            cached = (time.monotonic() + IMAGE_VERIFY_SECONDS, content_hash, data, mimetype)
+            image_cache.put(key, cached)
+
+        _, content_hash, data, mimetype = cached
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(f"{content_hash}-{width or 'full'}")
+        # Only a URL naming the exact content served may be cached forever
+        if request.args.get("v") == content_hash:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=300"
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"Error in get_event_image: {e}")
+        return jsonify(
+            {
+                "code": 500,
+                "message": f"Internal server error: {str(e)}"
+            }
+        ), 500
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
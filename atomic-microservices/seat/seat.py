@@ -3,10 +3,17 @@ from flask_cors import CORS
 import mongoengine as db
 from os import environ
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict
 import urllib.parse
 import logging
+import threading
+import base64
+import time
+import uuid
 from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 # Load environment variables from .env file
 load_dotenv()
@@ -36,6 +43,22 @@ try:
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {e}")
 
+# Seat holds: how long a hold lasts by default, the longest hold a client may ask for,
+# and how often the reaper releases expired holds
+HELD = "held"
+HOLD_TTL_SECONDS = int(os.getenv("SEAT_HOLD_TTL_SECONDS", "600"))
+MAX_HOLD_TTL_SECONDS = int(os.getenv("SEAT_MAX_HOLD_TTL_SECONDS", "1800"))
+HOLD_REAPER_INTERVAL_SECONDS = int(os.getenv("SEAT_HOLD_REAPER_INTERVAL_SECONDS", "30"))
+
+# Seat map deltas re-send changes this far behind "since", so writes that were in flight
+# while the previous map was built are never missed (re-applying a status is harmless)
+SEAT_MAP_DELTA_OVERLAP_MS = int(os.getenv("SEAT_MAP_DELTA_OVERLAP_MS", "5000"))
+
+# Seat availability cache: how many event dates to keep and for how long. The TTL bounds
+# how stale another replica's cache can be, since only this process's writes update it.
+SEAT_CACHE_MAX_ENTRIES = int(os.getenv("SEAT_CACHE_MAX_ENTRIES", "256"))
+SEAT_CACHE_TTL_SECONDS = float(os.getenv("SEAT_CACHE_TTL_SECONDS", "2"))
+
 class Seat(db.Document):
     eventID = db.StringField(required=True)
     eventDateID = db.StringField()
@@ -44,11 +67,16 @@ class Seat(db.Document):
     category = db.StringField()
     price = db.FloatField()
     status = db.StringField()
+    holdToken = db.StringField()  # set while status is "held"
+    holdExpiresAt = db.DateTimeField()  # UTC, set while status is "held"
+    version = db.LongField()  # ms timestamp of the last status change, see seat_version()
         
     meta = {
         'collection': 'Seat',
         'indexes': [
-            {'fields': ['eventDateID', 'eventDateTime', 'seatNo'], 'unique': True}
+            {'fields': ['eventDateID', 'eventDateTime', 'seatNo'], 'unique': True},
+            {'fields': ['status', 'holdExpiresAt']},  # used by the hold reaper
+            {'fields': ['eventID', 'eventDateTime', 'version']}  # used by seat map deltas
         ]
     }
 
@@ -63,6 +91,220 @@ class Seat(db.Document):
             "status": self.status
         }
 
+def parse_event_datetime(eventDateTime):
+    """Parse an eventDateTime from a URL or JSON body the same way for every route."""
+    eventDateTime = eventDateTime.replace(' ', '+')
+    dt = datetime.fromisoformat(eventDateTime)
+    return dt.replace(microsecond=0)
+
+def seat_version():
+    """Version stamped on a seat whenever its status changes (ms since epoch)."""
+    return int(time.time() * 1000)
+
+def holdable(holdToken, now):
+    """Seats a hold may claim: available ones, expired holds, or holds already owned by holdToken."""
+    return (db.Q(status="available")
+            | db.Q(status=HELD, holdExpiresAt__lt=now)
+            | db.Q(status=HELD, holdToken=holdToken))
+
+def not_held_by_others(holdToken, now):
+    """Seats a plain status write may change: not held, held past expiry, or held by holdToken."""
+    conditions = db.Q(status__ne=HELD) | db.Q(holdExpiresAt__lt=now)
+    if holdToken:
+        conditions |= db.Q(holdToken=holdToken)
+    return conditions
+
+def release_expired_holds():
+    """Return every seat whose hold has expired to "available"; returns the number released."""
+    return Seat.objects(status=HELD, holdExpiresAt__lt=datetime.utcnow()).update(
+        set__status="available", unset__holdToken=True, unset__holdExpiresAt=True, set__version=seat_version()
+    )
+
+def hold_reaper():
+    """Background loop releasing expired holds, so abandoned checkouts free their seats."""
+    while True:
+        try:
+            released = release_expired_holds()
+            if released:
+                logger.info(f"Released {released} expired seat holds")
+                seat_cache.invalidate()
+        except Exception as e:
+            logger.error(f"Error releasing expired seat holds: {e}")
+        time.sleep(HOLD_REAPER_INTERVAL_SECONDS)
+
+reaper_started = False
+reaper_lock = threading.Lock()
+
+@app.before_request
+def start_hold_reaper():
+    """Start one reaper per serving process, however the app is launched (flask run, gunicorn,
+    python seat.py); the debug reloader's watcher process serves no requests, so it runs none."""
+    global reaper_started
+    if reaper_started:
+        return
+    with reaper_lock:
+        if not reaper_started:
+            threading.Thread(target=hold_reaper, daemon=True).start()
+            reaper_started = True
+
+def encode_runs(values):
+    """Run-length encode a list as a flat [value, count, value, count, ...] list."""
+    runs = []
+    for value in values:
+        if runs and runs[-2] == value:
+            runs[-1] += 1
+        else:
+            runs.extend([value, 1])
+    return runs
+
+def build_seat_map(seats, encoding):
+    """Build the compact seat map from (seatNo, category, price, status) tuples sorted by seatNo.
+       Categories become price tables with seatNo ranges, statuses become one vector
+       indexed by seatNo - firstSeatNo: run-length encoded codes into statusCodes ("rle"),
+       or one bit per seat set when the seat is available ("bitmap").
+    """
+    first_seat_no = seats[0][0]
+    seat_count = seats[-1][0] - first_seat_no + 1
+
+    tables = {}
+    for seatNo, category, price, status in seats:
+        ranges = tables.setdefault((category, price), [])
+        if ranges and ranges[-1][1] == seatNo - 1:
+            ranges[-1][1] = seatNo
+        else:
+            ranges.append([seatNo, seatNo])
+    categories = [{"category": category, "price": price, "ranges": ranges}
+                  for (category, price), ranges in tables.items()]
+
+    if encoding == "bitmap":
+        bitmap = bytearray((seat_count + 7) // 8)
+        for seatNo, _, _, status in seats:
+            if status == "available":
+                index = seatNo - first_seat_no
+                bitmap[index // 8] |= 1 << (index % 8)
+        status_codes = None
+        status_vector = base64.b64encode(bytes(bitmap)).decode('ascii')
+    else:
+        status_codes = []
+        vector = [None] * seat_count  # None marks seat numbers that do not exist
+        for seatNo, _, _, status in seats:
+            if status not in status_codes:
+                status_codes.append(status)
+            vector[seatNo - first_seat_no] = status_codes.index(status)
+        status_vector = encode_runs(vector)
+
+    return {
+        "firstSeatNo": first_seat_no,
+        "seatCount": seat_count,
+        "categories": categories,
+        "encoding": encoding,
+        "statusCodes": status_codes,
+        "status": status_vector
+    }
+
+class SeatCache:
+    """Size-bounded LRU of the seats of an event date, keyed by (eventID, eventDateTime).
+       Each entry is a {seatNo: seat json} dict that expires ttl seconds after it was loaded.
+    """
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, seats = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return seats
+
+    def put(self, key, seats):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, seats)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def patch(self, key, seatNos, status):
+        """Write a status change through to a cached event date, if it is cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            for seatNo in seatNos:
+                seat = entry[1].get(seatNo)
+                if seat is not None:
+                    seat["status"] = status
+
+    def invalidate(self, key=None):
+        """Drop one event date, or everything when key is None."""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+seat_cache = SeatCache(SEAT_CACHE_MAX_ENTRIES, SEAT_CACHE_TTL_SECONDS)
+
+def cache_key(eventID, dt):
+    """Cache key for an event date; the same instant sent with different UTC offsets maps to one key."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (eventID, dt)
+
+def load_seats(eventID, dt):
+    """Seats of an event date as {seatNo: seat json}, from the cache or one projected query."""
+    key = cache_key(eventID, dt)
+    seats = seat_cache.get(key)
+    if seats is None:
+        rows = Seat.objects(eventID=eventID, eventDateTime=dt).only(
+            'eventID', 'eventDateID', 'eventDateTime', 'seatNo', 'category', 'price', 'status'
+        ).as_pymongo()
+        # Same shape as Seat.to_json, without building Seat documents
+        seats = {
+            row["seatNo"]: {
+                "eventID": row.get("eventID"),
+                "eventDateID": row.get("eventDateID"),
+                "eventDateTime": row.get("eventDateTime"),
+                "seatNo": row["seatNo"],
+                "category": row.get("category"),
+                "price": row.get("price"),
+                "status": row.get("status")
+            }
+            for row in rows
+        }
+        if seats:
+            seat_cache.put(key, seats)
+    return seats
+
+def read_hold_request(data, require_token):
+    """Validate the common body of the hold routes.
+       return: (eventID, eventDateTime, seatNos, holdToken, None) or (None, None, None, None, error message)
+    """
+    if not isinstance(data, dict) or not all(field in data for field in ["eventID", "eventDateTime"]):
+        return None, None, None, None, "Missing required fields."
+
+    seatNos = data.get("seatNos")
+    if not isinstance(seatNos, list) or not seatNos or not all(isinstance(seatNo, int) for seatNo in seatNos):
+        return None, None, None, None, "seatNos must be a non-empty list of seat numbers."
+
+    holdToken = data.get("holdToken")
+    if require_token and not holdToken:
+        return None, None, None, None, "Missing holdToken."
+
+    try:
+        dt = parse_event_datetime(data["eventDateTime"])
+    except (TypeError, ValueError):
+        return None, None, None, None, f"Invalid datetime format: {data['eventDateTime']}"
+
+    return data["eventID"], dt, seatNos, holdToken, None
+
 # Route 1
 @app.route('/seats')
 def get_all_seats():
@@ -72,7 +314,7 @@ def get_all_seats():
             return jsonify(
                 {
                     "code": 404,
-                    "message": f"No seats found."
+                    "message": "No seats found."
                 }
             ), 404
 
@@ -92,24 +334,21 @@ def get_all_seats():
 @app.route('/seats/<string:eventID>/<path:eventDateTime>')
 def get_seats_for_event(eventID, eventDateTime):
     try:
-        eventDateTime = eventDateTime.replace(' ', '+')
-
-        dt = datetime.fromisoformat(eventDateTime)
-        dt = dt.replace(microsecond=0)
+        dt = parse_event_datetime(eventDateTime)
 
-        seats = Seat.objects(eventID=eventID, eventDateTime=dt)
+        seats = load_seats(eventID, dt)
         if not seats:
             return jsonify(
                 {
                     "code": 404,
-                    "message": f"No seats found."
+                    "message": "No seats found."
                 }
             ), 404
 
 
         return jsonify({
             "code": 200,
-            "data": [seat.to_json() for seat in seats]
+            "data": [seats[seatNo] for seatNo in sorted(seats)]
         })
     except Exception as e:
         return jsonify({
@@ -120,7 +359,10 @@ def get_seats_for_event(eventID, eventDateTime):
 # Route 3
 @app.route('/seat', methods=['PUT'])
 def update_seat():
-    '''Update seat status'''
+    '''Update seat status.
+       json body: eventID, eventDateTime, seatNo, status, and holdToken when the seat is held
+       (a seat held by another, unexpired hold is not changed: 409). The hold is cleared.
+    '''
     # Get the request data (seat status and other necessary details)
     data = request.get_json()
     required_fields = ["eventID", "eventDateTime", "seatNo", "status"]
@@ -132,10 +374,22 @@ def update_seat():
     if not all(field in data for field in required_fields):
         return jsonify({"code": 400, "message": "Missing required fields."}), 400
     
-    seat = Seat.objects(eventID=data['eventID'], eventDateTime=data['eventDateTime'], seatNo=data['seatNo']).first()
-    
-    # Update the seat status
-    seat.update(status=data["status"])
+    if data["status"] == HELD:
+        return jsonify({"code": 400, "message": "Use /seats/hold to hold seats."}), 400
+
+    # Update the seat status, unless another checkout holds it
+    seat_filter = db.Q(eventID=data['eventID'], eventDateTime=data['eventDateTime'], seatNo=data['seatNo'])
+    updated = Seat.objects(seat_filter & not_held_by_others(data.get("holdToken"), datetime.utcnow())).update(
+        set__status=data["status"], unset__holdToken=True, unset__holdExpiresAt=True, set__version=seat_version()
+    )
+    if not updated:
+        if not Seat.objects(seat_filter).only('seatNo').first():
+            return jsonify({"code": 404, "message": "Seat not found."}), 404
+        return jsonify({"code": 409, "message": "Seat is held by another checkout."}), 409
+    try:
+        seat_cache.patch(cache_key(data['eventID'], parse_event_datetime(data['eventDateTime'])), [data['seatNo']], data["status"])
+    except (TypeError, ValueError):
+        seat_cache.invalidate()
 
     # Return a success response
     return jsonify({
@@ -151,5 +405,310 @@ def update_seat():
         }
     }), 200
 
+# Route 4
+@app.route('/seats/hold', methods=['POST'])
+def hold_seats():
+    '''Hold seats while the buyer is in checkout.
+       json body: eventID, eventDateTime, seatNos, optional holdToken (to extend an existing hold),
+       optional ttlSeconds, optional allOrNothing (default true)
+    '''
+    try:
+        data = request.get_json()
+        eventID, dt, seatNos, holdToken, error = read_hold_request(data, require_token=False)
+        if error:
+            return jsonify({"code": 400, "message": error}), 400
+
+        ttl = data.get("ttlSeconds", HOLD_TTL_SECONDS)
+        if not isinstance(ttl, int) or ttl <= 0 or ttl > MAX_HOLD_TTL_SECONDS:
+            return jsonify({"code": 400, "message": f"ttlSeconds must be between 1 and {MAX_HOLD_TTL_SECONDS}."}), 400
+
+        holdToken = holdToken or uuid.uuid4().hex
+        all_or_nothing = data.get("allOrNothing", True)
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+
+        # Seats this token already held before this request, with their expiry, so an
+        # all-or-nothing rollback gives back only what this call newly claimed
+        previously_held = {seat.seatNo: seat.holdExpiresAt for seat in Seat.objects(
+            eventID=eventID, eventDateTime=dt, seatNo__in=seatNos, status=HELD, holdToken=holdToken
+        ).only('seatNo', 'holdExpiresAt')} if data.get("holdToken") else {}
+
+        # Conditional update: only seats that are free (or already ours) change hands; the
+        # re-read below tells which of the requested seats this token now holds
+        seats = Seat.objects(db.Q(eventID=eventID, eventDateTime=dt, seatNo__in=seatNos) & holdable(holdToken, now))
+        seats.update(set__status=HELD, set__holdToken=holdToken, set__holdExpiresAt=expires_at, set__version=seat_version())
+
+        held = {seat.seatNo for seat in Seat.objects(eventID=eventID, eventDateTime=dt, seatNo__in=seatNos,
+                                                     status=HELD, holdToken=holdToken).only('seatNo')}
+        results = [{"seatNo": seatNo, "status": HELD if seatNo in held else "unavailable"} for seatNo in seatNos]
+        seat_cache.patch(cache_key(eventID, dt), held, HELD)
+
+        if len(held) < len(set(seatNos)) and all_or_nothing:
+            # Give back what this call grabbed so a partial hold never blocks other buyers; seats
+            # the token held before keep their hold, with the expiry they had
+            claimed = held - set(previously_held)
+            Seat.objects(eventID=eventID, eventDateTime=dt, seatNo__in=list(claimed), holdToken=holdToken).update(
+                set__status="available", unset__holdToken=True, unset__holdExpiresAt=True, set__version=seat_version()
+            )
+            kept = defaultdict(list)
+            for seatNo, previous_expiry in previously_held.items():
+                kept[previous_expiry].append(seatNo)
+            for previous_expiry, kept_seatNos in kept.items():
+                Seat.objects(eventID=eventID, eventDateTime=dt, seatNo__in=kept_seatNos, holdToken=holdToken).update(
+                    set__holdExpiresAt=previous_expiry, set__version=seat_version()
+                )
+            seat_cache.patch(cache_key(eventID, dt), claimed, "available")
+            return jsonify({
+                "code": 409,
+                "data": {"seats": [
+                    {"seatNo": seatNo, "status": HELD if seatNo in previously_held else "available" if seatNo in held else "unavailable"}
+                    for seatNo in seatNos
+                ]},
+                "message": "Some seats are no longer available."
+            }), 409
+
+        return jsonify({
+            "code": 200,
+            "data": {
+                "holdToken": holdToken,
+                "expiresAt": expires_at.isoformat() + "Z",
+                "seats": results
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"Error holding seats: {e}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error holding seats: {str(e)}"
+        }), 500
+
+# Route 5
+@app.route('/seats/release', methods=['POST'])
+def release_seats():
+    '''Release seats held under holdToken, e.g. when the buyer abandons checkout.
+       json body: eventID, eventDateTime, seatNos, holdToken
+    '''
+    try:
+        data = request.get_json()
+        eventID, dt, seatNos, holdToken, error = read_hold_request(data, require_token=True)
+        if error:
+            return jsonify({"code": 400, "message": error}), 400
+
+        released = Seat.objects(eventID=eventID, eventDateTime=dt, seatNo__in=seatNos,
+                                status=HELD, holdToken=holdToken).update(
+            set__status="available", unset__holdToken=True, unset__holdExpiresAt=True, set__version=seat_version()
+        )
+
+        seat_cache.invalidate(cache_key(eventID, dt))
+
+        return jsonify({
+            "code": 200,
+            "data": {"holdToken": holdToken, "released": released}
+        }), 200
+    except Exception as e:
+        logger.error(f"Error releasing seats: {e}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error releasing seats: {str(e)}"
+        }), 500
+
+# Route 6
+@app.route('/seats/confirm', methods=['POST'])
+def confirm_seats():
+    '''Turn an unexpired hold into a sale once payment succeeds.
+       json body: eventID, eventDateTime, seatNos, holdToken, optional status (default "reserved")
+    '''
+    try:
+        data = request.get_json()
+        eventID, dt, seatNos, holdToken, error = read_hold_request(data, require_token=True)
+        if error:
+            return jsonify({"code": 400, "message": error}), 400
+
+        confirmed = Seat.objects(eventID=eventID, eventDateTime=dt, seatNo__in=seatNos, status=HELD,
+                                 holdToken=holdToken, holdExpiresAt__gte=datetime.utcnow()).update(
+            set__status=data.get("status", "reserved"), unset__holdToken=True, unset__holdExpiresAt=True,
+            set__version=seat_version()
+        )
+        seat_cache.invalidate(cache_key(eventID, dt))
+
+        if confirmed < len(set(seatNos)):
+            return jsonify({
+                "code": 409,
+                "data": {"holdToken": holdToken, "confirmed": confirmed},
+                "message": "Hold expired or not found for some seats."
+            }), 409
+
+        return jsonify({
+            "code": 200,
+            "data": {"holdToken": holdToken, "confirmed": confirmed}
+        }), 200
+    except Exception as e:
+        logger.error(f"Error confirming seats: {e}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error confirming seats: {str(e)}"
+        }), 500
+
+# Route 7
+@app.route('/seats', methods=['PUT'])
+def update_seats():
+    '''Update the status of many seats with a single bulk write.
+       json body: {"seats": [{"eventID", "eventDateTime", "seatNo", "status", optional "eventDateID"}, ...]}
+    '''
+    try:
+        data = request.get_json()
+        items = data.get("seats") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"code": 400, "message": "Request body must contain a non-empty 'seats' list."}), 400
+
+        required_fields = ["eventID", "eventDateTime", "seatNo", "status"]
+        parsed = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not all(field in item for field in required_fields):
+                return jsonify({"code": 400, "message": f"Missing required fields in seat {index}."}), 400
+            if item["status"] == HELD:
+                return jsonify({"code": 400, "message": "Use /seats/hold to hold seats."}), 400
+            try:
+                dt = parse_event_datetime(item["eventDateTime"])
+            except (TypeError, ValueError):
+                return jsonify({"code": 400, "message": f"Invalid datetime format: {item['eventDateTime']}"}), 400
+            parsed.append((item, dt))
+
+        # Filter on eventDateID/eventDateTime/seatNo so every update hits the unique index;
+        # look up the eventDateID once per event date when the caller did not send it
+        eventDateIDs = {}
+        for item, dt in parsed:
+            key = (item["eventID"], dt)
+            if item.get("eventDateID"):
+                eventDateIDs.setdefault(key, item["eventDateID"])
+        for item, dt in parsed:
+            key = (item["eventID"], dt)
+            if key not in eventDateIDs:
+                seat = Seat.objects(eventID=item["eventID"], eventDateTime=dt).only('eventDateID').first()
+                eventDateIDs[key] = seat.eventDateID if seat else None
+
+        results = []
+        operations = []
+        version = seat_version()
+        for item, dt in parsed:
+            result = {"eventID": item["eventID"], "eventDateTime": item["eventDateTime"],
+                      "seatNo": item["seatNo"], "status": item["status"]}
+            eventDateID = eventDateIDs[(item["eventID"], dt)]
+            if eventDateID is None:
+                result["result"] = "not_found"
+            else:
+                result["result"] = "updated"
+                result["_filter"] = {"eventDateID": eventDateID, "eventDateTime": dt, "seatNo": item["seatNo"]}
+                operations.append(UpdateOne(
+                    result["_filter"],
+                    {"$set": {"status": item["status"], "version": version}, "$unset": {"holdToken": "", "holdExpiresAt": ""}}
+                ))
+            results.append(result)
+
+        matched = modified = 0
+        failed = set()
+        if operations:
+            try:
+                write_result = Seat._get_collection().bulk_write(operations, ordered=False)
+                matched, modified = write_result.matched_count, write_result.modified_count
+            except BulkWriteError as e:
+                matched, modified = e.details.get("nMatched", 0), e.details.get("nModified", 0)
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+
+        to_write = [result for result in results if "_filter" in result]
+        for index, result in enumerate(to_write):
+            if index in failed:
+                result["result"] = "error"
+
+        # Counts alone cannot say which seats were missing; one query settles it
+        if matched + len(failed) < len(to_write):
+            existing = {
+                (seat.eventDateID, seat.seatNo)
+                for seat in Seat.objects(
+                    eventDateID__in=list({result["_filter"]["eventDateID"] for result in to_write}),
+                    seatNo__in=list({result["seatNo"] for result in to_write})
+                ).only('eventDateID', 'seatNo')
+            }
+            for result in to_write:
+                if result["result"] == "updated" and (result["_filter"]["eventDateID"], result["seatNo"]) not in existing:
+                    result["result"] = "not_found"
+
+        for result in results:
+            result.pop("_filter", None)
+
+        for eventID, dt in eventDateIDs:
+            seat_cache.invalidate(cache_key(eventID, dt))
+
+        return jsonify({
+            "code": 200,
+            "data": {
+                "matched": matched,
+                "modified": modified,
+                "seats": results
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"Error updating seats: {e}")
+        return jsonify({
+            "code": 500,
+            "message": f"Error updating seats: {str(e)}"
+        }), 500
+
+# Route 8
+@app.route('/seatmap/<string:eventID>/<path:eventDateTime>')
+def get_seat_map(eventID, eventDateTime):
+    '''Compact seat map for an event date.
+       query params: encoding ("rle" or "bitmap", default "rle");
+       since (a version from an earlier response) to only get seats changed after it
+    '''
+    try:
+        dt = parse_event_datetime(eventDateTime)
+
+        encoding = request.args.get("encoding", "rle")
+        if encoding not in ("rle", "bitmap"):
+            return jsonify({"code": 400, "message": "encoding must be 'rle' or 'bitmap'."}), 400
+
+        since = request.args.get("since", type=int)
+        # Taken before querying, so anything written during the query shows up in the next delta
+        version = seat_version()
+
+        if since is not None:
+            changed = Seat.objects(eventID=eventID, eventDateTime=dt,
+                                   version__gt=since - SEAT_MAP_DELTA_OVERLAP_MS).only('seatNo', 'status').as_pymongo()
+            return jsonify({
+                "code": 200,
+                "data": {
+                    "eventID": eventID,
+                    "eventDateTime": eventDateTime,
+                    "version": version,
+                    "since": since,
+                    "changes": sorted([seat["seatNo"], seat.get("status")] for seat in changed)
+                }
+            })
+
+        seats = sorted((seat["seatNo"], seat["category"], seat["price"], seat["status"])
+                       for seat in load_seats(eventID, dt).values())
+        if not seats:
+            return jsonify(
+                {
+                    "code": 404,
+                    "message": "No seats found."
+                }
+            ), 404
+
+        seat_map = build_seat_map(seats, encoding)
+        seat_map.update({"eventID": eventID, "eventDateTime": eventDateTime, "version": version})
+        return jsonify({
+            "code": 200,
+            "data": seat_map
+        })
+    except ValueError:
+        return jsonify({"code": 400, "message": f"Invalid datetime format: {eventDateTime}"}), 400
+    except Exception as e:
+        return jsonify({
+            "code": 500,
+            "message": f"Error retrieving seat map: {str(e)}"
+        }), 500
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
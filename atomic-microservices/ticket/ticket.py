@@ -1,23 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from flask_graphql import GraphQLView
+from graphql import parse, validate, execute
+from graphql.backend import GraphQLCoreBackend, GraphQLDocument
+from graphql.execution import ExecutionResult
+from graphql_server import HttpQueryError
 import graphene
+from promise import Promise
+from promise.dataloader import DataLoader
 import mongoengine as db
-from datetime import datetime
+from datetime import datetime, timezone
 from os import environ
 import os
 import re
-from datetime import datetime
 import urllib.parse
 import logging
 from dotenv import load_dotenv
+from rabbitmq_publisher import RabbitMQPublisher
 import requests
-import pika
-import json
 import qrcode
 import base64
 from io import BytesIO
 import jwt
+import threading
+import click
+import hashlib
+import uuid
+import time
+from pymongo.errors import BulkWriteError
+import bisect
+import heapq
+from itertools import islice
+from collections import OrderedDict
 
 # Load environment variables from .env file
 load_dotenv()
@@ -35,6 +49,26 @@ CORS(app)
 
 EVENT_SERVICE_URL = os.getenv("EVENT_SERVICE_URL", "http://event_service:5001")
 
+# In-memory resale order books (GET /tickets/resale/search); only safe while this process
+# is the single writer of Ticket, so off by default
+RESALE_ORDER_BOOK = os.getenv("RESALE_ORDER_BOOK", "false").lower() == "true"
+RESALE_ORDER_BOOK_MAX_DATES = int(os.getenv("RESALE_ORDER_BOOK_MAX_DATES", "256"))
+RESALE_SEARCH_DEFAULT_LIMIT = 20
+RESALE_SEARCH_MAX_LIMIT = 200
+
+# Parsed and validated GraphQL documents kept for reuse (also the persisted-query store)
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.getenv("GRAPHQL_DOCUMENT_CACHE_SIZE", "500"))
+
+# Node number (0-1023) for server-generated ticket IDs. Required, and must be unique per
+# replica (e.g. the StatefulSet ordinal): two replicas with the same node number can
+# allocate the same IDs (inserts still refuse duplicates, see create_ticket)
+TICKET_NODE_ID = os.getenv("TICKET_NODE_ID")
+if TICKET_NODE_ID is None:
+    raise RuntimeError("TICKET_NODE_ID must be set to a node number (0-1023) unique to this replica")
+TICKET_NODE_ID = int(TICKET_NODE_ID)
+# Fresh IDs tried by POST /ticket when an allocated ID turns out to exist already
+TICKET_ID_ATTEMPTS = 3
+
 # MongoDB connection details from environment variables
 username = os.getenv("MONGO_USERNAME")
 password = urllib.parse.quote_plus(os.getenv("MONGO_PASSWORD"))
@@ -60,34 +94,24 @@ RABBITMQ_PORT = 5672
 RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'guest')
 RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'guest')
 
+publisher = RabbitMQPublisher(
+    host=RABBITMQ_HOST,
+    port=RABBITMQ_PORT,
+    user=RABBITMQ_USER,
+    password=RABBITMQ_PASS,
+    exchange='ticketing',
+    channels=int(os.getenv("RABBITMQ_PUBLISHER_CHANNELS", "2")),
+    outbox_size=int(os.getenv("RABBITMQ_OUTBOX_SIZE", "10000")),
+    batch_size=int(os.getenv("RABBITMQ_BATCH_SIZE", "100")),
+    max_attempts=int(os.getenv("RABBITMQ_BATCH_MAX_ATTEMPTS", "5"))
+)
+
 def publish_to_rabbitmq(routing_key, message):
-    try:
-        # Create connection parameters
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=credentials
-        )
-        
-        # Connect to RabbitMQ
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        
-        # Publish message
-        channel.basic_publish(
-            exchange='ticketing',
-            routing_key=routing_key,
-            body=json.dumps(message)
-        )
-        
-        # Close connection
-        connection.close()
-        logger.info(f"Published message with routing key: {routing_key}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to publish to RabbitMQ: {e}")
-        return False
+    return publisher.publish(routing_key, message)
+
+def publish_batch_to_rabbitmq(routing_key, messages):
+    """Queue several messages; they go out together in the publisher's next batches."""
+    return all([publisher.publish(routing_key, message) for message in messages])
 
 # Define MongoDB models
 class Ticket(db.Document): # tell flask what are the fields in your database
@@ -104,8 +128,20 @@ class Ticket(db.Document): # tell flask what are the fields in your database
     status = db.StringField()
     paymentID = db.StringField() # can be "" for mock tickets
     isCheckedIn = db.BooleanField()
+    checkInBatch = db.StringField()  # set by POST /tickets/checkin to tell which call checked the ticket in
 
-    meta = {'collection': 'Ticket'} 
+    meta = {
+        'collection': 'Ticket',
+        'indexes': [
+            {'fields': ['ownerID']},  # GET /tickets/<ownerID>
+            {'fields': ['status', 'eventID', 'eventDateTime']},  # GET /tickets/resale, GET /tickets/<eventID>/<eventDateTime>
+            {'fields': ['status', 'eventID', 'resalePrice']},  # GET /tickets/resale/search
+            {'fields': ['eventID', 'eventDateTime']},  # GET /tickets/roster/<eventID>/<eventDateTime>
+        ],
+        # Built by build_indexes() at startup instead of on first query
+        'auto_create_index': False,
+        'index_background': True
+    }
 
     def to_json(self):
         return {
@@ -127,12 +163,300 @@ class Ticket(db.Document): # tell flask what are the fields in your database
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
+def build_indexes():
+    """Create the declared Ticket indexes (background builds; a no-op if they already exist)."""
+    try:
+        logger.info("Building Ticket indexes...")
+        Ticket.ensure_indexes()
+        logger.info("Ticket indexes are ready")
+    except Exception as e:
+        logger.error(f"Failed to build Ticket indexes: {e}")
+
+# Build indexes off the request path so startup is not blocked on a large collection
+threading.Thread(target=build_indexes, daemon=True).start()
+
+# Query shapes of the ticket routes, with placeholder values, for check_query_plans()
+ROUTE_QUERIES = {
+    "GET /ticket/<ticketID>": lambda: Ticket.objects(ticketID="T0000"),
+    "GET /tickets/<ownerID>": lambda: Ticket.objects(ownerID="U000"),
+    "GET /tickets/resale": lambda: Ticket.objects(status="available"),
+    "GET /tickets/resale/search": lambda: Ticket.objects(
+        status="available", eventID="E000", resalePrice__lte=100).order_by("resalePrice", "ticketID"),
+    "GET /tickets/roster/<eventID>/<eventDateTime>": lambda: Ticket.objects(
+        eventID="E000", eventDateTime=datetime(2025, 1, 1)).only("ticketID", "seatNo", "status", "isCheckedIn"),
+    "GET /tickets/<eventID>/<eventDateTime>": lambda: Ticket.objects(
+        eventID="E000", eventDateTime=datetime(2025, 1, 1), status="available"),
+}
+
+def plan_stages(plan):
+    """All stage names in a winning plan tree, root first."""
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+def check_query_plans():
+    """Explain every ticket route query; returns {route: {"stages": [...], "collscan": bool}}."""
+    report = {}
+    for route, query in ROUTE_QUERIES.items():
+        plan = query().explain()["queryPlanner"]["winningPlan"]
+        stages = plan_stages(plan.get("queryPlan", plan))  # queryPlan is nested on the SBE engine
+        report[route] = {"stages": stages, "collscan": "COLLSCAN" in stages}
+    return report
+
+@app.cli.command("build-indexes")
+def build_indexes_command():
+    """Build the Ticket indexes and wait for them."""
+    build_indexes()
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Report which ticket routes hit COLLSCAN; exits with status 1 if any do."""
+    report = check_query_plans()
+    for route, result in report.items():
+        flag = "COLLSCAN" if result["collscan"] else "ok"
+        click.echo(f"{flag:9} {route}: {' <- '.join(result['stages'])}")
+    if any(result["collscan"] for result in report.values()):
+        raise SystemExit(1)
+
+class TicketIDGenerator:
+    """Compact, time-ordered ticket IDs: "T" + 13 Crockford base32 digits of a 64-bit number
+    made of 42 bits of milliseconds since 2025-01-01 UTC, a 10-bit node number and a
+    12-bit per-millisecond sequence. IDs from one node sort in creation order, as strings
+    too, and do not collide with those of another node as long as node numbers are unique.
+    """
+    EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+    def __init__(self, node_id):
+        if not 0 <= node_id < 1024:
+            raise ValueError(f"node_id must be between 0 and 1023, got {node_id}")
+        self.node_id = node_id
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def now_ms(self):
+        return int(time.time() * 1000) - self.EPOCH_MS
+
+    def next_id(self):
+        while True:
+            with self.lock:
+                now_ms = self.now_ms()
+                exhausted = now_ms <= self.last_ms and self.sequence == 0xFFF
+                if not exhausted:
+                    if now_ms > self.last_ms:
+                        self.last_ms, self.sequence = now_ms, 0
+                    else:
+                        # Same millisecond, or the clock stepped back: stay on last_ms, never reuse an ID
+                        self.sequence += 1
+                    value = (self.last_ms << 22) | (self.node_id << 12) | self.sequence
+                    break
+                wait_ms = self.last_ms + 1 - now_ms
+            # 4096 IDs in this millisecond: wait for the next one without holding the lock
+            time.sleep(wait_ms / 1000)
+
+        digits = []
+        for _ in range(13):
+            digits.append(self.ALPHABET[value & 31])
+            value >>= 5
+        return "T" + "".join(reversed(digits))
+
+ticket_ids = TicketIDGenerator(TICKET_NODE_ID)
+
+# Fields every ticket payload must carry (ticketID is passed separately)
+TICKET_REQUIRED_FIELDS = ["ownerID",
+                          "ownerName",
+                          "eventID",
+                          "eventName",
+                          "eventDateTime",
+                          "seatNo",
+                          "seatCategory",
+                          "price",
+                          "resalePrice",
+                          "status",
+                          "paymentID",
+                          "isCheckedIn"]
+
+def validate_ticket_data(data):
+    """Validate a ticket payload.
+       return: (parsed eventDateTime, None) if valid, otherwise (None, error message)
+    """
+    missing_fields = [field for field in TICKET_REQUIRED_FIELDS if field not in data]
+    if missing_fields:
+        logger.error(f"Missing required fields: {missing_fields}")
+        return None, f"Missing required fields: {', '.join(missing_fields)}"
+
+    if not isinstance(data["seatNo"], int):
+        logger.error(f"Invalid seatNo type: {type(data['seatNo'])}")
+        return None, "Seat number must be an integer."
+
+    if data["seatNo"] <= 0:
+        logger.error(f"Invalid seatNo value: {data['seatNo']}")
+        return None, "Seat number must be positive."
+
+    if not isinstance(data["price"], (int, float)) or data["price"] < 0:
+        logger.error(f"Invalid price value: {data['price']}")
+        return None, "Price must be a non-negative number."
+
+    try:
+        event_datetime = datetime.fromisoformat(data["eventDateTime"].replace("Z", "+00:00"))
+    except ValueError as e:
+        logger.error(f"Error parsing datetime: {e}")
+        return None, f"Invalid datetime format: {data['eventDateTime']}"
+
+    return event_datetime, None
+
+def build_ticket(ticketID, data, event_datetime):
+    """Build an unsaved Ticket document from a validated payload."""
+    return Ticket(
+        ticketID=ticketID,
+        ownerID=data["ownerID"],
+        ownerName=data["ownerName"],
+        eventID=data["eventID"],
+        eventName=data["eventName"],
+        eventDateTime=event_datetime,
+        seatNo=data["seatNo"],
+        seatCategory=data["seatCategory"],
+        price=data["price"],
+        resalePrice=data["resalePrice"],
+        status=data["status"],
+        paymentID=data["paymentID"],
+        isCheckedIn=data["isCheckedIn"]
+    )
+
+def build_purchase_message(ticketID, data):
+    """Build the ticket.purchased message consumed by the email service."""
+    return {
+        "ownerID": data["ownerID"],
+        "user_name": data["ownerName"],
+        "_id": ticketID,
+        "event_id": data["eventID"],
+        "event_name": data["eventName"],
+        "eventDateTime": data["eventDateTime"],
+        "seatNo": data["seatNo"],
+        "seatCategory": data["seatCategory"],
+        "price": data["price"]
+    }
+
+def utc_naive(value):
+    """Datetimes come back from MongoDB as naive UTC; bring aware values to the same form."""
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class ResaleOrderBook:
+    """Resale listings of recently searched event dates, kept sorted by (resalePrice, ticketID).
+
+    A book is loaded from MongoDB on its first search and then kept current by apply(),
+    which update_ticket and the create routes call with the ticket they wrote. The least
+    recently searched event dates are dropped beyond max_dates.
+    """
+    def __init__(self, max_dates):
+        self.max_dates = max_dates
+        self.books = OrderedDict()  # (eventID, eventDateTime) -> {"keys": [...], "tickets": {...}}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def sort_key(ticket):
+        return (ticket["resalePrice"] if ticket["resalePrice"] is not None else float("inf"), ticket["ticketID"])
+
+    def load(self, eventID, eventDateTime):
+        docs = Ticket.objects(status="available", eventID=eventID, eventDateTime=eventDateTime).as_pymongo()
+        tickets = {ticket["ticketID"]: ticket for ticket in map(raw_ticket, docs)}
+        book = {"keys": sorted(self.sort_key(ticket) for ticket in tickets.values()), "tickets": tickets}
+        with self.lock:
+            self.books[(eventID, eventDateTime)] = book
+            while len(self.books) > self.max_dates:
+                self.books.popitem(last=False)
+        return book
+
+    def listings(self, eventID, eventDateTime):
+        """(resalePrice, ticketID) keys and tickets of an event date, loading it if needed."""
+        with self.lock:
+            book = self.books.get((eventID, eventDateTime))
+            if book:
+                self.books.move_to_end((eventID, eventDateTime))
+                return list(book["keys"]), dict(book["tickets"])
+        book = self.load(eventID, eventDateTime)
+        return list(book["keys"]), dict(book["tickets"])
+
+    def apply(self, ticket):
+        """Add, move or drop a written ticket in its event date's book, if that book is loaded."""
+        with self.lock:
+            book = self.books.get((ticket["eventID"], utc_naive(ticket["eventDateTime"])))
+            if book is None:
+                return
+            previous = book["tickets"].pop(ticket["ticketID"], None)
+            if previous:
+                book["keys"].pop(bisect.bisect_left(book["keys"], self.sort_key(previous)))
+            if ticket["status"] == "available":
+                book["tickets"][ticket["ticketID"]] = ticket
+                bisect.insort(book["keys"], self.sort_key(ticket))
+
+    def search(self, eventID, eventDateTime, seatCategory, minPrice, maxPrice, sort, limit):
+        keys, tickets = self.listings(eventID, eventDateTime)
+        # Keys are sorted by price, so the price range is a slice
+        low = 0 if minPrice is None else bisect.bisect_left(keys, minPrice, key=lambda key: key[0])
+        high = len(keys) if maxPrice is None else bisect.bisect_right(keys, maxPrice, key=lambda key: key[0])
+        keys = keys[low:high]
+        if sort == "-resalePrice":
+            keys.reverse()
+        matches = (
+            tickets[ticketID] for price, ticketID in keys
+            if seatCategory is None or tickets[ticketID]["seatCategory"] == seatCategory
+        )
+        if sort == "seatNo":
+            return heapq.nsmallest(limit, matches, key=lambda ticket: (ticket["seatNo"], ticket["ticketID"]))
+        return list(islice(matches, limit))
+
+resale_order_book = ResaleOrderBook(RESALE_ORDER_BOOK_MAX_DATES) if RESALE_ORDER_BOOK else None
+
+def apply_to_order_book(ticket):
+    if resale_order_book:
+        resale_order_book.apply(ticket)
+
 # Define GraphQL Queries
 class EventDetails(graphene.ObjectType):
     eventID = graphene.String()
     eventName = graphene.String()
     eventDateTime = graphene.DateTime()
 
+class TicketType(graphene.ObjectType):
+    class Meta:
+        name = "Ticket"
+
+    ticketID = graphene.String()
+    ownerID = graphene.String()
+    ownerName = graphene.String()
+    eventID = graphene.String()
+    eventName = graphene.String()
+    eventDateTime = graphene.DateTime()
+    seatNo = graphene.Int()
+    seatCategory = graphene.String()
+    price = graphene.Float()
+    resalePrice = graphene.Float()
+    status = graphene.String()
+    paymentID = graphene.String()
+    isCheckedIn = graphene.Boolean()
+    eventDetails = graphene.Field(EventDetails)
+
+    def resolve_eventDetails(ticket, info):
+        return EventDetails(eventID=ticket.eventID, eventName=ticket.eventName, eventDateTime=ticket.eventDateTime)
+
+class TicketLoader(DataLoader):
+    """Collects the ticketIDs resolved in one GraphQL request and loads them with one $in query."""
+    def batch_load_fn(self, ticketIDs):
+        tickets = {ticket.ticketID: ticket for ticket in Ticket.objects(ticketID__in=ticketIDs)}
+        return Promise.resolve([tickets.get(ticketID) for ticketID in ticketIDs])
+
+def ticket_loader():
+    """The TicketLoader of the current request (a new one per request, so nothing is cached across requests)."""
+    if "ticket_loader" not in g:
+        g.ticket_loader = TicketLoader()
+    return g.ticket_loader
+
 class Query(graphene.ObjectType):
     """
     GraphQL Query class to fetch ticket details.
@@ -140,6 +464,12 @@ class Query(graphene.ObjectType):
     Available Queries:
     1. is_checked_in(ticketID: <string>): Returns the check-in status (Boolean) of a given ticket.
     2. event_details(ticketID: <string>): Returns eventID and eventDateTime of a given ticket
+    3. ticket(ticketID: <string>): Returns a ticket
+    4. tickets(ids: [<string>]): Returns the given tickets, in order (null for unknown IDs)
+    5. tickets_by_owner(ownerID: <string>): Returns the tickets of a user
+
+    All ticket lookups in one request are batched into a single query, so asking for
+    several fields or tickets at once costs one database round trip.
 
     Example Queries:
     ```
@@ -154,46 +484,206 @@ class Query(graphene.ObjectType):
             eventDateTime
         }
     }
+
+    query {
+        tickets(ids: ["T001", "T002"]) {
+            ticketID
+            status
+            isCheckedIn
+        }
+        ticketsByOwner(ownerID: "U001") {
+            ticketID
+            eventDetails { eventName eventDateTime }
+        }
+    }
     ```
     """
     is_checked_in = graphene.Boolean(ticketID=graphene.String(required=True))
     event_details = graphene.Field(EventDetails, ticketID=graphene.String(required=True))
+    ticket = graphene.Field(TicketType, ticketID=graphene.String(required=True))
+    tickets = graphene.List(TicketType, ids=graphene.List(graphene.NonNull(graphene.String), required=True))
+    tickets_by_owner = graphene.List(TicketType, ownerID=graphene.String(required=True))
 
     # Query for isCheckedIn
     def resolve_is_checked_in(self, info, ticketID):
-        ticket = Ticket.objects(ticketID=ticketID).first()
-        if ticket:
-            return ticket.isCheckedIn
-        return None  # If no ticket found, return None
+        # None if no ticket found
+        return ticket_loader().load(ticketID).then(lambda ticket: ticket.isCheckedIn if ticket else None)
 
     # Query for eventDetails
     def resolve_event_details(self, info, ticketID):
         """Resolves event details (event id, event name and event date) for the given ticketID."""
-        ticket = Ticket.objects(ticketID=ticketID).first()
-        if ticket:
-            return EventDetails(eventID=ticket.eventID, eventName=ticket.eventName, eventDateTime=ticket.eventDateTime)
-        return None 
+        return ticket_loader().load(ticketID).then(
+            lambda ticket: TicketType.resolve_eventDetails(ticket, info) if ticket else None)
+
+    def resolve_ticket(self, info, ticketID):
+        return ticket_loader().load(ticketID)
+
+    def resolve_tickets(self, info, ids):
+        return ticket_loader().load_many(ids)
+
+    def resolve_tickets_by_owner(self, info, ownerID):
+        tickets = list(Ticket.objects(ownerID=ownerID))
+        loader = ticket_loader()
+        for ticket in tickets:
+            loader.prime(ticket.ticketID, ticket)  # later lookups of these tickets skip the database
+        return tickets
     
 # Define the schema
 schema = graphene.Schema(query=Query)
 
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """Parses and validates each distinct query once; later requests with the same query text
+    (or its sha256 hash, see PersistedQueryView) execute the cached document directly.
+    Invalid queries are not cached.
+    """
+    def __init__(self, max_entries):
+        super().__init__()
+        self.max_entries = max_entries
+        self.documents = OrderedDict()  # sha256 of query text -> GraphQLDocument
+        self.lock = threading.Lock()
+
+    def get(self, sha256):
+        with self.lock:
+            document = self.documents.get(sha256)
+            if document:
+                self.documents.move_to_end(sha256)
+            return document
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+
+        sha256 = query_hash(document_string)
+        document = self.get(sha256)
+        if document:
+            return document
+
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        if errors:
+            return GraphQLDocument(schema=schema, document_string=document_string, document_ast=document_ast,
+                                   execute=lambda *args, **kwargs: ExecutionResult(errors=errors, invalid=True))
+
+        document = GraphQLDocument(schema=schema, document_string=document_string, document_ast=document_ast,
+                                   execute=lambda *args, **kwargs: execute(schema, document_ast, *args, **kwargs))
+        with self.lock:
+            self.documents[sha256] = document
+            while len(self.documents) > self.max_entries:
+                self.documents.popitem(last=False)
+        return document
+
+graphql_backend = CachedDocumentBackend(GRAPHQL_DOCUMENT_CACHE_SIZE)
+
+class PersistedQueryView(GraphQLView):
+    """GraphQLView with automatic persisted queries (the Apollo protocol).
+
+    A client may send {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": ...}}}
+    without the query text. If the hash is unknown the reply is a PersistedQueryNotFound
+    error, and the client sends the query again together with its hash to register it.
+    """
+    def parse_body(self):
+        data = super().parse_body()
+        if isinstance(data, list):
+            return [self.resolve_persisted_query(params) for params in data]
+        return self.resolve_persisted_query(data)
+
+    def resolve_persisted_query(self, params):
+        persisted_query = (params.get("extensions") or {}).get("persistedQuery") if isinstance(params, dict) else None
+        if not persisted_query:
+            return params
+
+        sha256 = persisted_query.get("sha256Hash")
+        if params.get("query"):
+            if query_hash(params["query"]) != sha256:
+                raise HttpQueryError(400, "provided sha does not match query")
+            return params  # registered when the backend caches it
+
+        document = graphql_backend.get(sha256)
+        if not document:
+            raise HttpQueryError(200, "PersistedQueryNotFound")
+        return dict(params, query=document.document_string)
+
 # Add the GraphQL view with the schema
 app.add_url_rule(
     '/graphql', 
-    view_func=GraphQLView.as_view('graphql', schema=schema, graphiql=True)
+    view_func=PersistedQueryView.as_view('graphql', schema=schema, graphiql=True, backend=graphql_backend)
 )
 
+# Fields of Ticket.to_json, in order; list routes accept a ?fields= subset of these
+TICKET_FIELDS = ["ticketID", "ownerID", "ownerName", "eventID", "eventName", "eventDateTime",
+                 "seatNo", "seatCategory", "price", "resalePrice", "status", "paymentID", "isCheckedIn"]
+
+def ticket_list_params():
+    """Read fields/after/limit/stream query params; returns (params, error response)."""
+    fields = request.args.get("fields")
+    fields = [field for field in fields.split(",") if field in TICKET_FIELDS] if fields else TICKET_FIELDS
+    limit = request.args.get("limit", type=int)
+    stream = request.args.get("stream")
+    if limit is not None and limit < 1:
+        return None, (jsonify({"code": 400, "message": "limit must be a positive integer."}), 400)
+    if stream not in (None, "ndjson", "json"):
+        return None, (jsonify({"code": 400, "message": "stream must be 'ndjson' or 'json'."}), 400)
+    return {"fields": fields or ["ticketID"], "after": request.args.get("after"),
+            "limit": limit, "stream": stream}, None
+
+def raw_ticket(doc, fields=TICKET_FIELDS):
+    """Ticket.to_json-shaped dict (limited to fields) from an as_pymongo document."""
+    doc["ticketID"] = doc.pop("_id")
+    return {field: doc.get(field) for field in fields}
+
+def list_tickets(query, params):
+    """Projected raw cursor over query in ticketID order, starting after params["after"]."""
+    if params["after"]:
+        query = query.filter(ticketID__gt=params["after"])
+    query = query.order_by("ticketID").only(*params["fields"])
+    if params["limit"]:
+        query = query.limit(params["limit"])
+    for doc in query.as_pymongo():
+        yield raw_ticket(doc, params["fields"])
+
+def ticket_list_response(query, params):
+    """Tickets as one JSON body, or streamed from the cursor as NDJSON / chunked JSON.
+
+    With a limit, the JSON body carries pagination.nextAfter (the ticketID to pass as
+    ?after= for the next page, null on the last page).
+    """
+    tickets = list_tickets(query, params)
+
+    if params["stream"] == "ndjson":
+        def generate():
+            for ticket in tickets:
+                yield app.json.dumps(ticket) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    if params["stream"] == "json":
+        def generate():
+            yield '{"code": 200, "data": {"tickets": ['
+            for i, ticket in enumerate(tickets):
+                yield ("," if i else "") + app.json.dumps(ticket)
+            yield ']}}'
+        return Response(stream_with_context(generate()), mimetype="application/json")
+
+    data = {"tickets": list(tickets)}
+    if params["limit"]:
+        full_page = len(data["tickets"]) == params["limit"]
+        data["pagination"] = {"limit": params["limit"],
+                              "nextAfter": data["tickets"][-1]["ticketID"] if full_page else None}
+    return jsonify({"code": 200, "data": data}), 200
+
 # Route 1
 @app.route('/ticket', methods=['GET'])
 def get_all_tickets():
+    '''query params (all optional): after (ticketID to continue after), limit (page size),
+       fields (comma-separated Ticket fields), stream ("ndjson" or "json" to stream the result)
+    '''
     try:
-        tickets = Ticket.objects()
-        return jsonify({
-            "code": 200,
-            "data": {
-                "tickets": [ticket.to_json() for ticket in tickets]
-            }
-        })
+        params, error = ticket_list_params()
+        if error:
+            return error
+        return ticket_list_response(Ticket.objects(), params)
     except Exception as e:
         return jsonify({
             "code": 500,
@@ -203,16 +693,14 @@ def get_all_tickets():
 # Route 2
 @app.route('/tickets/resale', methods=['GET'])
 def get_resale_tickets():
-    """Get all tickets currently listed for resale (status='available')."""
+    """Get tickets currently listed for resale (status='available').
+       Takes the same after / limit / fields / stream query params as GET /ticket.
+    """
     try:
-        resale_tickets = Ticket.objects(status="available")
-        
-        if not resale_tickets:
-            # It's okay if none are available, return empty list
-            return jsonify({"code": 200, "data": {"tickets": []}}), 200 
-
-        tickets_data = [ticket.to_json() for ticket in resale_tickets]
-        return jsonify({"code": 200, "data": {"tickets": tickets_data}}), 200
+        params, error = ticket_list_params()
+        if error:
+            return error
+        return ticket_list_response(Ticket.objects(status="available"), params)
         
     except Exception as e:
         logger.error(f"Error retrieving resale tickets: {str(e)}")
@@ -270,28 +758,32 @@ def get_tickets_by_user(ownerID):
 # Route 6 [PUT]
 @app.route('/ticket/<string:ticketID>', methods=['PUT'])
 def update_ticket(ticketID):
-    # Find the ticket by ticketID
-    ticket = Ticket.objects(ticketID=ticketID).first()
-
-    if not ticket:
-        return jsonify({"code": 404, "message": "Ticket not found."}), 404
-
-    # Get the request data to update
+    '''Update ticket fields in one atomic find-and-modify.
+       json body: fields to set, plus optional preconditions expectedStatus / expectedOwner
+       (ownerID) / expectedCheckedIn; the update only applies if the ticket still matches them,
+       otherwise 409
+    '''
     data = request.get_json()
+    expected_status = data.pop("expectedStatus", None)
+    expected_owner = data.pop("expectedOwner", None)
+    expected_checked_in = data.pop("expectedCheckedIn", None)
 
-    # Validate resalePrice if present in the request
-    if 'resalePrice' in data:
-        new_resale_price = data['resalePrice']
-        if new_resale_price > ticket.price or (ticket.resalePrice is not None and new_resale_price > ticket.resalePrice):
-            return jsonify({
-                "code": 400,
-                "data": {"ticketID": ticketID},
-                "message": "Resale price cannot be higher than the original price or the previous resale price."
-            }), 400
+    conditions = db.Q(ticketID=ticketID)
+    if expected_status is not None:
+        conditions &= db.Q(status=expected_status)
+    if expected_owner is not None:
+        conditions &= db.Q(ownerID=expected_owner)
+    if expected_checked_in is not None:
+        # Tickets created without isCheckedIn count as not checked in
+        conditions &= db.Q(isCheckedIn=True) if expected_checked_in else db.Q(isCheckedIn__ne=True)
+    # A resale price may not exceed the original price, nor an existing resale price
+    new_resale_price = data.get('resalePrice')
+    checks_resale_price = isinstance(new_resale_price, (int, float))
+    if checks_resale_price:
+        conditions &= db.Q(price__gte=new_resale_price) & (db.Q(resalePrice=None) | db.Q(resalePrice__gte=new_resale_price))
 
-    # Update the ticket with new values from the request
     try:
-        ticket.update(**data)
+        updated_ticket = Ticket.objects(conditions).modify(new=True, **data)
     except (db.errors.ValidationError, db.errors.OperationError, Exception) as e:
         logger.error(f"Error updating ticket {ticketID}: {str(e)}")
         return jsonify({
@@ -300,140 +792,96 @@ def update_ticket(ticketID):
             "message": f"An error occurred updating the ticket: {str(e)}"
         }), 500
 
-    # Return the updated ticket data
-    updated_ticket = Ticket.objects(ticketID=ticketID).first()
+    if not updated_ticket:
+        # Nothing matched: read the ticket once to report why
+        ticket = Ticket.objects(ticketID=ticketID).first()
+        if not ticket:
+            return jsonify({"code": 404, "message": "Ticket not found."}), 404
+
+        preconditions_hold = (expected_status is None or ticket.status == expected_status) and \
+            (expected_owner is None or ticket.ownerID == expected_owner) and \
+            (expected_checked_in is None or bool(ticket.isCheckedIn) == expected_checked_in)
+        price_rule_broken = checks_resale_price and (
+            ticket.price is None or ticket.price < new_resale_price or
+            (ticket.resalePrice is not None and ticket.resalePrice < new_resale_price))
+
+        if preconditions_hold and price_rule_broken:
+            return jsonify({
+                "code": 400,
+                "data": {"ticketID": ticketID},
+                "message": "Resale price cannot be higher than the original price or the previous resale price."
+            }), 400
+
+        # Either a precondition failed, or the ticket changed between the update and this read
+        return jsonify({
+            "code": 409,
+            "data": {"ticketID": ticketID, "status": ticket.status, "ownerID": ticket.ownerID,
+                     "isCheckedIn": bool(ticket.isCheckedIn)},
+            "message": "Ticket does not match the expected status, owner or check-in state, "
+                       "or was modified concurrently."
+        }), 409
+
+    apply_to_order_book(updated_ticket.to_json())
 
     return jsonify({
         "code": 200,
-        "data": {
-            "ticketID": updated_ticket.ticketID,
-            "ownerID": updated_ticket.ownerID,
-            "ownerName": updated_ticket.ownerName,
-            "eventID": updated_ticket.eventID,
-            "eventName": updated_ticket.eventName,
-            "eventDateTime": updated_ticket.eventDateTime,
-            "seatNo": updated_ticket.seatNo,
-            "seatCategory": updated_ticket.seatCategory,
-            "price": updated_ticket.price,
-            "resalePrice": updated_ticket.resalePrice,
-            "status": updated_ticket.status,
-            "paymentID": updated_ticket.paymentID,
-            "isCheckedIn": updated_ticket.isCheckedIn
-        }
+        "data": updated_ticket.to_json()
     }), 200
 
 
 # Route 7 [POST]
+@app.route("/ticket", methods=["POST"], defaults={"ticketID": None})
 @app.route("/ticket/<string:ticketID>", methods=["POST"])
 def create_ticket(ticketID):
+    '''Create a ticket; POST /ticket (no ticketID) allocates a new unique ticketID'''
     try:
+        client_id = ticketID is not None
+        ticketID = ticketID or ticket_ids.next_id()
         logger.info(f"Attempting to create ticket with ID: {ticketID}")
-        
-        # Check if ticket already exists
-        if Ticket.objects(ticketID=ticketID).first():
-            logger.warning(f"Ticket {ticketID} already exists")
-            return jsonify({
-                "code": 409,
-                "data": {"ticketID": ticketID},
-                "message": "Ticket already exists."
-            }), 409
 
         # Get request data
         data = request.get_json()
         logger.info(f"Received ticket data: {data}")
 
         # Validate input
-        required_fields = ["ownerID",
-                           "ownerName",
-                           "eventID",
-                           "eventName",
-                           "eventDateTime",
-                           "seatNo",
-                           "seatCategory",
-                           "price",
-                           "resalePrice",
-                           "status",
-                           "paymentID",
-                           "isCheckedIn"] #ticketID in url
-        
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            logger.error(f"Missing required fields: {missing_fields}")
-            return jsonify({
-                "code": 400,
-                "message": f"Missing required fields: {', '.join(missing_fields)}"
-            }), 400
-
-        if not isinstance(data["seatNo"], int):
-            logger.error(f"Invalid seatNo type: {type(data['seatNo'])}")
-            return jsonify({
-                "code": 400,
-                "message": "Seat number must be an integer."
-            }), 400
-    
-        if data["seatNo"] <= 0:
-            logger.error(f"Invalid seatNo value: {data['seatNo']}")
-            return jsonify({
-                "code": 400,
-                "message": "Seat number must be positive."
-            }), 400
-
-        if not isinstance(data["price"], (int, float)) or data["price"] < 0:
-            logger.error(f"Invalid price value: {data['price']}")
+        event_datetime, error = validate_ticket_data(data)
+        if error:
             return jsonify({
                 "code": 400,
-                "message": "Price must be a non-negative number."
-            }), 400
-        
-        try:
-            event_datetime = datetime.fromisoformat(data["eventDateTime"].replace("Z", "+00:00"))
-        except ValueError as e:
-            logger.error(f"Error parsing datetime: {e}")
-            return jsonify({
-                "code": 400,
-                "message": f"Invalid datetime format: {data['eventDateTime']}"
+                "message": error
             }), 400
 
-        # Create and save the new ticket
-        try:
-            ticket = Ticket(
-                ticketID=ticketID,
-                ownerID=data["ownerID"],
-                ownerName=data["ownerName"],
-                eventID=data["eventID"],
-                eventName=data["eventName"],
-                eventDateTime=event_datetime,
-                seatNo=data["seatNo"],
-                seatCategory=data["seatCategory"],
-                price=data["price"],
-                resalePrice=data["resalePrice"],
-                status=data["status"],
-                paymentID=data["paymentID"],
-                isCheckedIn=data["isCheckedIn"]
-            )
-            ticket.save()
-        except Exception as e:
-            logger.error(f"Error saving ticket: {str(e)}")
-            raise
+        # Insert the new ticket: a plain save() would replace an existing ticket with the same ID.
+        # A duplicate client-chosen ID is a 409; a duplicate server-allocated one (only possible
+        # if two replicas share a TICKET_NODE_ID) is retried with a fresh ID
+        for attempt in range(TICKET_ID_ATTEMPTS):
+            try:
+                ticket = build_ticket(ticketID, data, event_datetime)
+                ticket.save(force_insert=True)
+                break
+            except db.errors.NotUniqueError:
+                if client_id or attempt == TICKET_ID_ATTEMPTS - 1:
+                    logger.warning(f"Ticket {ticketID} already exists")
+                    return jsonify({
+                        "code": 409,
+                        "data": {"ticketID": ticketID},
+                        "message": "Ticket already exists."
+                    }), 409
+                logger.error(f"Allocated ticketID {ticketID} already exists; is TICKET_NODE_ID unique per replica?")
+                ticketID = ticket_ids.next_id()
+            except Exception as e:
+                logger.error(f"Error saving ticket: {str(e)}")
+                raise
+        apply_to_order_book(ticket.to_json())
 
         # Prepare message for email service
-        message = {
-            "ownerID": data["ownerID"],
-            "user_name": data["ownerName"],
-            "_id": ticketID,
-            "event_id": data["eventID"],
-            "event_name": data["eventName"],
-            "eventDateTime": data["eventDateTime"],
-            "seatNo": data["seatNo"],
-            "seatCategory": data["seatCategory"],
-            "price": data["price"]
-        }
+        message = build_purchase_message(ticketID, data)
 
         # Publish to RabbitMQ
         if publish_to_rabbitmq('ticket.purchased', message):
-            logger.info("Successfully published to RabbitMQ")
+            logger.info("Queued ticket.purchased message")
         else:
-            logger.warning("Failed to publish to RabbitMQ")
+            logger.warning("Failed to queue ticket.purchased message")
 
         # Return successful response
         return jsonify({
@@ -451,6 +899,222 @@ def create_ticket(ticketID):
             "message": f"An error occurred creating the ticket: {str(e)}"
         }), 500
 
+# Route 8 [POST]
+@app.route("/tickets", methods=["POST"])
+def create_tickets():
+    '''Create several tickets in one call, e.g. for a multi-seat order or a comp batch.
+       json body: {"tickets": [{"ticketID": ..., <same fields as POST /ticket/<ticketID>>}, ...]}
+       ticketID is optional; tickets without one get a server-allocated ID (returned in data.tickets).
+       All or nothing: if any client-chosen ticketID already exists (or repeats in the request),
+       no ticket is created and the 409 reply lists the conflicts (data.conflicts, data.ticketIDs).
+    '''
+    try:
+        data = request.get_json()
+        tickets_data = data.get("tickets") if isinstance(data, dict) else None
+
+        if not isinstance(tickets_data, list) or not tickets_data:
+            return jsonify({
+                "code": 400,
+                "message": "Request body must contain a non-empty 'tickets' list."
+            }), 400
+
+        logger.info(f"Attempting to create {len(tickets_data)} tickets")
+
+        # Validate every ticket before writing anything
+        tickets = []
+        errors = []
+        for index, ticket_data in enumerate(tickets_data):
+            ticketID = ticket_data.get("ticketID") or ticket_ids.next_id()
+
+            event_datetime, error = validate_ticket_data(ticket_data)
+            if error:
+                errors.append({"index": index, "ticketID": ticketID, "message": error})
+                continue
+
+            ticket = build_ticket(ticketID, ticket_data, event_datetime)
+            try:
+                ticket.validate()
+            except db.ValidationError as e:
+                errors.append({"index": index, "ticketID": ticketID, "message": f"Invalid ticket: {str(e)}"})
+                continue
+            tickets.append(ticket)
+
+        if errors:
+            return jsonify({
+                "code": 400,
+                "data": {"errors": errors},
+                "message": "One or more tickets are invalid."
+            }), 400
+
+        # Unordered insert: every ticket that can be written is, and duplicate ticketIDs
+        # (already stored or repeated in the request) are collected per item. Duplicates of
+        # server-allocated IDs (only possible if replicas share a TICKET_NODE_ID) get fresh IDs
+        client_ids = {index for index, ticket_data in enumerate(tickets_data) if ticket_data.get("ticketID")}
+        pending = list(range(len(tickets)))
+        conflicts = []
+        for attempt in range(TICKET_ID_ATTEMPTS):
+            failed = set()
+            try:
+                Ticket._get_collection().insert_many([tickets[index].to_mongo() for index in pending], ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details["writeErrors"]:
+                    if write_error["code"] != 11000:  # not a duplicate key
+                        raise
+                    failed.add(pending[write_error["index"]])
+
+            conflicts = [index for index in sorted(failed) if index in client_ids or attempt == TICKET_ID_ATTEMPTS - 1]
+            pending = [index for index in sorted(failed) if index not in conflicts]
+            for index in pending:
+                logger.error(f"Allocated ticketID {tickets[index].ticketID} already exists; is TICKET_NODE_ID unique per replica?")
+                tickets[index].ticketID = ticket_ids.next_id()
+            if not pending:
+                break
+
+        if conflicts:
+            # Take back the tickets that were inserted, so the caller can treat the 409 as
+            # "nothing created" (no orphan tickets, no purchase emails)
+            created_ids = [ticket.ticketID for index, ticket in enumerate(tickets) if index not in conflicts]
+            if created_ids:
+                Ticket.objects(ticketID__in=created_ids).delete()
+            conflicts = [{"index": index, "ticketID": tickets[index].ticketID} for index in conflicts]
+            logger.warning(f"Tickets already exist, none created: {[conflict['ticketID'] for conflict in conflicts]}")
+            return jsonify({
+                "code": 409,
+                "data": {
+                    "conflicts": conflicts,
+                    "ticketIDs": sorted({conflict["ticketID"] for conflict in conflicts})
+                },
+                "message": "Ticket already exists."
+            }), 409
+
+        created = tickets
+        logger.info(f"Created tickets: {[ticket.ticketID for ticket in created]}")
+        for ticket in created:
+            apply_to_order_book(ticket.to_json())
+
+        messages = [build_purchase_message(ticket.ticketID, tickets_data[index]) for index, ticket in enumerate(tickets)]
+        if not publish_batch_to_rabbitmq('ticket.purchased', messages):
+            logger.warning(f"Failed to queue ticket.purchased messages for tickets {[ticket.ticketID for ticket in created]}")
+
+        return jsonify({
+            "code": 201,
+            "data": {
+                "tickets": [ticket.to_json() for ticket in created]
+            }
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error in create_tickets: {str(e)}")
+        return jsonify({
+            "code": 500,
+            "message": f"An error occurred creating the tickets: {str(e)}"
+        }), 500
+
+
+# Route 9
+@app.route('/tickets/resale/search', methods=['GET'])
+def search_resale_tickets():
+    '''Cheapest (or otherwise sorted) resale listings.
+       query params (all optional): eventID, eventDateTime (ISO), seatCategory, minPrice, maxPrice,
+       sort ("resalePrice" (default), "-resalePrice" or "seatNo"), limit (top K, default 20, max 200)
+    '''
+    eventID = request.args.get("eventID")
+    seatCategory = request.args.get("seatCategory")
+    minPrice = request.args.get("minPrice", type=float)
+    maxPrice = request.args.get("maxPrice", type=float)
+    sort = request.args.get("sort", "resalePrice")
+    limit = request.args.get("limit", RESALE_SEARCH_DEFAULT_LIMIT, type=int)
+
+    if sort not in ("resalePrice", "-resalePrice", "seatNo"):
+        return jsonify({"code": 400, "message": "sort must be 'resalePrice', '-resalePrice' or 'seatNo'."}), 400
+    if not 1 <= limit <= RESALE_SEARCH_MAX_LIMIT:
+        return jsonify({"code": 400, "message": f"limit must be between 1 and {RESALE_SEARCH_MAX_LIMIT}."}), 400
+    eventDateTime = None
+    if request.args.get("eventDateTime"):
+        try:
+            eventDateTime = utc_naive(datetime.fromisoformat(request.args["eventDateTime"].replace("Z", "+00:00")))
+        except ValueError:
+            return jsonify({"code": 400, "message": f"Invalid datetime format: {request.args['eventDateTime']}"}), 400
+
+    try:
+        if resale_order_book and eventID and eventDateTime:
+            tickets = resale_order_book.search(eventID, eventDateTime, seatCategory, minPrice, maxPrice, sort, limit)
+        else:
+            filters = {"status": "available"}
+            if eventID:
+                filters["eventID"] = eventID
+            if eventDateTime:
+                filters["eventDateTime"] = eventDateTime
+            if seatCategory:
+                filters["seatCategory"] = seatCategory
+            if minPrice is not None:
+                filters["resalePrice__gte"] = minPrice
+            if maxPrice is not None:
+                filters["resalePrice__lte"] = maxPrice
+            query = Ticket.objects(**filters).order_by(sort, "ticketID").limit(limit)
+            tickets = [raw_ticket(doc) for doc in query.as_pymongo()]
+
+        return jsonify({"code": 200, "data": {"tickets": tickets}}), 200
+    except Exception as e:
+        logger.error(f"Error searching resale tickets: {str(e)}")
+        return jsonify({"code": 500, "message": f"Error searching resale tickets: {str(e)}"}), 500
+
+# Route 10 [POST]
+@app.route('/tickets/checkin', methods=['POST'])
+def check_in_tickets():
+    '''Check in a batch of tickets (e.g. scans buffered at a gate) with one conditional update.
+       json body: {"ticketIDs": [...]}
+       return: data.checkedIn (checked in by this call), data.alreadyCheckedIn, data.notFound
+    '''
+    data = request.get_json()
+    ticketIDs = data.get("ticketIDs") if isinstance(data, dict) else None
+    if not isinstance(ticketIDs, list) or not ticketIDs:
+        return jsonify({"code": 400, "message": "Request body must contain a non-empty 'ticketIDs' list."}), 400
+
+    try:
+        # Only tickets not yet checked in are updated, atomically per ticket, and stamped with
+        # this call's batch ID so a concurrent batch for the same ticket cannot claim it too
+        batch = uuid.uuid4().hex
+        Ticket.objects(ticketID__in=ticketIDs, isCheckedIn__ne=True).update(set__isCheckedIn=True, set__checkInBatch=batch)
+        stamped = {doc["_id"]: doc.get("checkInBatch") == batch
+                   for doc in Ticket.objects(ticketID__in=ticketIDs).only("ticketID", "checkInBatch").as_pymongo()}
+    except Exception as e:
+        logger.error(f"Error checking in tickets: {str(e)}")
+        return jsonify({"code": 500, "message": f"An error occurred checking in the tickets: {str(e)}"}), 500
+
+    unique_ticketIDs = list(dict.fromkeys(ticketIDs))
+    return jsonify({
+        "code": 200,
+        "data": {
+            "checkedIn": [ticketID for ticketID in unique_ticketIDs if stamped.get(ticketID)],
+            "alreadyCheckedIn": [ticketID for ticketID in unique_ticketIDs if stamped.get(ticketID) is False],
+            "notFound": [ticketID for ticketID in unique_ticketIDs if ticketID not in stamped]
+        }
+    }), 200
+
+# Route 11
+@app.route('/tickets/roster/<string:eventID>/<string:eventDateTime>', methods=['GET'])
+def get_roster(eventID, eventDateTime):
+    '''Check-in roster of an event date, read with one projected query and returned as
+       parallel arrays: data.ticketIDs, data.seatNos, data.statuses, data.checkedIn
+    '''
+    try:
+        event_datetime = utc_naive(datetime.fromisoformat(eventDateTime.replace("Z", "+00:00")))
+    except ValueError:
+        return jsonify({"code": 400, "message": f"Invalid datetime format: {eventDateTime}"}), 400
+
+    tickets = Ticket.objects(eventID=eventID, eventDateTime=event_datetime) \
+        .only("ticketID", "seatNo", "status", "isCheckedIn").as_pymongo()
+    roster = {"eventID": eventID, "eventDateTime": eventDateTime,
+              "ticketIDs": [], "seatNos": [], "statuses": [], "checkedIn": []}
+    for ticket in tickets:
+        roster["ticketIDs"].append(ticket["_id"])
+        roster["seatNos"].append(ticket.get("seatNo"))
+        roster["statuses"].append(ticket.get("status"))
+        roster["checkedIn"].append(bool(ticket.get("isCheckedIn")))
+
+    return jsonify({"code": 200, "data": roster}), 200
+
 
 # # === QR Code Generation Endpoint (Simplified for Debugging) ===
 # @app.route('/generateQR/<string:ticketID>', methods=['POST'])
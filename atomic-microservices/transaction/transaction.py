@@ -4,7 +4,6 @@ import mongoengine as db
 from datetime import datetime
 from os import environ
 import os
-from datetime import datetime
 import urllib.parse
 import logging
 from dotenv import load_dotenv
@@ -103,5 +102,80 @@ def create_transaction():
         }
     }), 201
 
+# Route 2
+@app.route('/transactions', methods=['POST'])
+def create_transactions():
+    '''Create several transactions in one call.
+       json body: {"transactions": [{<same fields as POST /transaction>}, ...]}
+    '''
+    data = request.get_json()
+    transactions_data = data.get("transactions") if isinstance(data, dict) else None
+    required_fields = ["transactionID",
+                       "type",
+                       "userID",
+                       "ticketID",
+                       "paymentID",
+                       "amount"]
+
+    if not isinstance(transactions_data, list) or not transactions_data:
+        return jsonify({"code": 400, "message": "Request body must contain a non-empty 'transactions' list."}), 400
+
+    for transaction_data in transactions_data:
+        if not all(field in transaction_data for field in required_fields):
+            return jsonify({"code": 400, "message": "Missing required fields."}), 400
+
+        if transaction_data["type"] not in ["purchase", "refund"]:
+            return jsonify({"code": 400, "message": "Invalid transaction type."}), 400
+
+    # Reject duplicate transactionIDs, both within the request and already stored, with one query
+    transactionIDs = [transaction_data["transactionID"] for transaction_data in transactions_data]
+    conflicts = {transactionID for transactionID in transactionIDs if transactionIDs.count(transactionID) > 1}
+    conflicts.update(transaction.transactionID for transaction in Transaction.objects(transactionID__in=transactionIDs).only("transactionID"))
+    if conflicts:
+        return jsonify({
+            "code": 409,
+            "data": {"transactionIDs": sorted(conflicts)},
+            "message": "Transaction ID already exists."
+        }), 409
+
+    transactionDate = datetime.now()
+    transactions = [
+        Transaction(
+            transactionID=transaction_data["transactionID"],
+            type=transaction_data["type"],
+            userID=transaction_data["userID"],
+            ticketID=transaction_data["ticketID"],
+            paymentID=transaction_data["paymentID"],
+            amount=transaction_data["amount"],
+            transactionDate=transactionDate
+        )
+        for transaction_data in transactions_data
+    ]
+    try:
+        for transaction in transactions:
+            transaction.validate()
+    except db.ValidationError as e:
+        return jsonify({"code": 400, "message": f"Invalid transaction: {str(e)}"}), 400
+
+    Transaction.objects.insert(transactions, load_bulk=False)
+
+    return jsonify({
+        "code": 201,
+        "data": {
+            "transactions": [
+                {
+                    "transactionID": transaction.transactionID,
+                    "type": transaction.type,
+                    "userID": transaction.userID,
+                    "ticketID": transaction.ticketID,
+                    "paymentID": transaction.paymentID,
+                    "amount": transaction.amount,
+                    "transactionDate": transaction.transactionDate.strftime('%Y-%m-%d %H:%M:%S')
+                }
+                for transaction in transactions
+            ]
+        }
+    }), 201
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5005, debug=True)
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""Batched RabbitMQ publisher shared by the ticket and user services.
+
+Each service's Dockerfile copies this file next to the service, like invokes.py in the
+composite services; keep the copies identical.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import pika
+
+logger = logging.getLogger(__name__)
+
+class RabbitMQPublisher:
+    """Long-lived publisher: publish() only appends to a bounded in-memory outbox and returns.
+
+    Each of `channels` worker threads owns one connection and channel (pika connections are
+    not thread-safe), takes up to `batch_size` messages from the outbox at a time and
+    publishes them, reconnecting with backoff when the broker goes away.
+
+    The channel is transactional: a batch is published and then committed with a single
+    tx_commit, so the broker acknowledges the whole batch in one round trip (a confirm-mode
+    BlockingChannel would wait for an ack after every message). A batch whose commit was not
+    acknowledged is published again on the new connection, so delivery is at least once.
+    A batch that keeps failing once connected (e.g. the exchange is missing) is logged in full
+    and dropped after `max_attempts` tries, so it cannot stall its worker forever.
+    """
+    def __init__(self, host, port, user, password, exchange, channels, outbox_size, batch_size, max_attempts):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.exchange = exchange
+        self.channels = channels
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.outbox = queue.Queue(maxsize=outbox_size)
+        self.started = False
+        self.lock = threading.Lock()
+
+    def connect(self):
+        credentials = pika.PlainCredentials(self.user, self.password)
+        parameters = pika.ConnectionParameters(
+            host=self.host,
+            port=self.port,
+            credentials=credentials,
+            heartbeat=60
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.tx_select()
+        return connection, channel
+
+    def publish(self, routing_key, message):
+        """Queue a message; False if the outbox is full (the message is dropped)."""
+        if not self.started:
+            self.start()
+        try:
+            self.outbox.put_nowait((routing_key, json.dumps(message)))
+            return True
+        except queue.Full:
+            logger.error(f"RabbitMQ outbox full, dropping message with routing key: {routing_key}")
+            return False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            for _ in range(self.channels):
+                threading.Thread(target=self.run, daemon=True).start()
+            self.started = True
+
+    def next_batch(self):
+        try:
+            batch = [self.outbox.get(timeout=1)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.outbox.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        connection = None
+        batch = []
+        attempts = 0  # failed publishes of the current batch on an open connection
+        backoff = 1
+        while True:
+            publishing = False
+            try:
+                if connection is None or connection.is_closed:
+                    connection, channel = self.connect()
+                    backoff = 1
+                batch = batch or self.next_batch()
+                if batch:
+                    publishing = True
+                    for routing_key, body in batch:
+                        channel.basic_publish(exchange=self.exchange, routing_key=routing_key, body=body)
+                    channel.tx_commit()  # one broker round trip for the whole batch
+                    logger.info(f"Published {len(batch)} message(s) with routing keys: "
+                                f"{sorted({routing_key for routing_key, _ in batch})}")
+                    batch, attempts = [], 0
+                connection.process_data_events(time_limit=0)  # heartbeats while idle
+            except Exception as e:
+                logger.error(f"RabbitMQ publisher error, reconnecting in {backoff}s: {e}")
+                if publishing:
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        logger.error(f"Dropping batch of {len(batch)} message(s) after {attempts} failed attempts: {batch}")
+                        batch, attempts = [], 0
+                try:
+                    if connection and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+                connection = None
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
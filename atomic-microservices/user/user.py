@@ -8,9 +8,8 @@ from datetime import datetime, timedelta
 import urllib.parse
 import logging
 from dotenv import load_dotenv
+from rabbitmq_publisher import RabbitMQPublisher
 import jwt
-import pika
-import json
 
 # Load environment variables from .env file
 load_dotenv()
@@ -57,35 +56,21 @@ else:
 RABBITMQ_USER = os.getenv('RABBITMQ_USER', 'guest')
 RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'guest')
 
+publisher = RabbitMQPublisher(
+    host=RABBITMQ_HOST,
+    port=RABBITMQ_PORT,
+    user=RABBITMQ_USER,
+    password=RABBITMQ_PASS,
+    exchange='ticketing',
+    channels=int(os.getenv("RABBITMQ_PUBLISHER_CHANNELS", "2")),
+    outbox_size=int(os.getenv("RABBITMQ_OUTBOX_SIZE", "10000")),
+    batch_size=int(os.getenv("RABBITMQ_BATCH_SIZE", "100")),
+    max_attempts=int(os.getenv("RABBITMQ_BATCH_MAX_ATTEMPTS", "5"))
+)
+
 def publish_to_rabbitmq(routing_key, message):
-    try:
-        # Create connection parameters
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=credentials
-        )
-        
-        # Connect to RabbitMQ
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        
-        # Publish message
-        channel.basic_publish(
-            exchange='ticketing',
-            routing_key=routing_key,
-            body=json.dumps(message)
-        )
-        
-        # Close connection
-        connection.close()
-        logger.info(f"Published message with routing key: {routing_key}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to publish to RabbitMQ: {e}")
-        return False
-    
+    return publisher.publish(routing_key, message)
+
 class User(db.Document): # tell flask what are the fields in your database
     _id = db.StringField(primary_key=True) 
     name = db.StringField()
@@ -5,7 +5,7 @@ import os, sys
 import requests
 import pika
 import json
-from invokes import invoke_http
+from invokes import invoke_http, invoke_many
 import time
 import logging
 from requests.exceptions import ConnectionError, RequestException
@@ -27,6 +27,9 @@ transaction_URL = "http://kong:8000/transaction"
 user_URL = "http://kong:8000/user"
 payment_URL = "http://kong:8000"
 
+# Seconds allowed for each attempt at a group of concurrent service calls
+FANOUT_DEADLINE = float(os.getenv("FANOUT_DEADLINE", "10"))
+
 def get_rabbitmq_connection():
     """Get a RabbitMQ connection with retry logic"""
     for attempt in range(5):
@@ -94,6 +97,28 @@ def invoke_http_with_retry(url, method='GET', json=None, max_retries=3, retry_de
             logger.warning(f"Request failed (attempt {attempt + 1}/{max_retries}): {e}")
             time.sleep(retry_delay)
 
+def invoke_many_with_retry(calls, max_retries=3, retry_delay=1):
+    """Send independent calls concurrently; like invoke_http_with_retry, calls answered with
+       code 500, 502, 503 or 504 (connection errors included) are sent again, together, after
+       retry_delay. Check each result with check_service_result."""
+    results = [None] * len(calls)
+    todo = list(range(len(calls)))
+    for attempt in range(max_retries):
+        if attempt:
+            logger.warning(f"{len(todo)} request(s) failed (attempt {attempt}/{max_retries}), retrying")
+            time.sleep(retry_delay)
+        for i, result in zip(todo, invoke_many([calls[i] for i in todo], deadline=FANOUT_DEADLINE)):
+            results[i] = result
+        todo = [i for i in todo if isinstance(results[i], dict) and results[i].get('code') in [500, 502, 503, 504]]
+        if not todo:
+            break
+    return results
+
+def check_service_result(result):
+    if isinstance(result, dict) and result.get('code') in [500, 502, 503, 504]:
+        raise Exception(f"Service returned error code: {result.get('code')}: {result.get('message', '')}")
+    return result
+
 
 @app.route("/buyresaleticket/<string:ticketID>", methods=['POST'])
 def buy_resale_ticket(ticketID):
@@ -147,15 +172,84 @@ def buy_resale_ticket(ticketID):
         "message": f"Invalid JSON input: {str(request.get_data())}"
     }), 400
 
+def claim_resale_ticket(ticketID, update_data, max_attempts=3, retry_delay=1):
+    """Send the conditional claim PUT without trusting a failed reply: the PUT is not
+       idempotent (once applied, sending it again gets a 409), so after a 409 or an error
+       the ticket is read back to learn whether this purchase owns it.
+       return: ("claimed", None), ("lost", None) when another buyer has the ticket or it is no
+            longer listed, or ("error", {"code": ..., "message": ...}) when the outcome is unknown
+    """
+    ticket_url = f"{ticket_URL}/{ticketID}"
+    error = {"code": 500, "message": "Ticket update failed."}
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(retry_delay)
+        result = invoke_http(ticket_url, method='PUT', json=update_data)
+        code = result.get("code") if isinstance(result, dict) else 500
+        if code == 200:
+            return "claimed", None
+        if code not in [409, 500, 502, 503, 504]:
+            return "error", {"code": code, "message": f"Unexpected response code: {code}"}
+
+        current = invoke_http(ticket_url)
+        if not isinstance(current, dict) or current.get("code") != 200:
+            error = {"code": 500, "message": f"Ticket update failed with code {code} and the ticket could not be re-read."}
+            continue
+        data = current["data"]
+        if data.get("ownerID") == update_data["ownerID"] and data.get("paymentID") == update_data["paymentID"]:
+            logger.info(f"Ticket {ticketID} was claimed by this purchase although the update reported code {code}")
+            return "claimed", None
+        if data.get("status") != update_data["expectedStatus"] or data.get("ownerID") != update_data["expectedOwner"] \
+                or data.get("isCheckedIn"):
+            return "lost", None
+        # Still listed by the seller, so the claim did not apply and sending it again is safe
+        error = {"code": 500, "message": f"Ticket update failed with code {code}."}
+    return "error", error
+
+def refund_unfulfilled_purchase(userID, ticketID, paymentID, message):
+    """The buyer has already paid when a resale purchase is rejected: refund their payment
+       and build the 409 reply, flagging the payment for manual compensation if the refund fails."""
+    logger.info(f'\n-----Refunding payment {paymentID} of user {userID} for unavailable ticket {ticketID}-----')
+    try:
+        refund_result = invoke_http_with_retry(
+            f"{payment_URL}/makerefund",
+            method='POST',
+            json={"payment_intent": paymentID, "reason": "requested_by_customer"}
+        )
+        refunded = isinstance(refund_result, dict) and bool(refund_result.get("success"))
+    except Exception as e:
+        logger.error(f"Error refunding payment {paymentID}: {e}")
+        refunded = False
+
+    if refunded:
+        return {
+            "code": 409,
+            "data": {"ticketID": ticketID, "paymentID": paymentID, "refunded": True},
+            "message": f"{message} Your payment has been refunded."
+        }
+
+    logger.error(f"COMPENSATION NEEDED: payment {paymentID} of user {userID} for ticket {ticketID} was not refunded")
+    return {
+        "code": 409,
+        "data": {"ticketID": ticketID, "paymentID": paymentID, "refunded": False},
+        "message": f"{message} Your payment could not be refunded automatically and will be refunded manually."
+    }
+
 def process_buy_resale_ticket(userID, ticketID, paymentID):
     try:
         logger.info(f"\n=== Starting process_buy_resale_ticket ===")
         logger.info(f"Parameters: userID={userID}, ticketID={ticketID}, paymentID={paymentID}")
         
-        # Step 2-3: Get user name and email from userID
-        logger.info(f'\n-----Invoking user microservice for user {userID}-----')
+        # Step 2-5: Get user name and email from userID and the ticket details concurrently
+        logger.info(f'\n-----Invoking user microservice for user {userID} and ticket microservice for ticket {ticketID}-----')
+        ticket_url = f"{ticket_URL}/{ticketID}"
+        user, ticket = invoke_many_with_retry([
+            {"url": f"{user_URL}/{userID}"},
+            {"url": ticket_url},
+        ])
+
         try:
-            user = invoke_http_with_retry(f"{user_URL}/{userID}")
+            check_service_result(user)
         except Exception as e:
             logger.error(f"Error calling user service: {e}")
             return {"code": 500, "message": f"Error retrieving user details: {str(e)}"}
@@ -164,18 +258,13 @@ def process_buy_resale_ticket(userID, ticketID, paymentID):
         userEmail = user["data"]["email"]
         logger.info(f"Retrieved user details: name={userName}, email={userEmail}")
         
-        # Step 4-5: Get ticket details
-        logger.info(f'\n-----Invoking ticket microservice for ticket {ticketID}-----')
-        ticket_url = f"{ticket_URL}/{ticketID}"
         try:
-            ticket = invoke_http_with_retry(ticket_url)
-                
+            check_service_result(ticket)
+
             # Check if ticket is already paid
             if ticket["data"].get("status") == "paid":
-                return {
-                    "code": 409,
-                    "message": "Ticket is already paid and cannot be updated."
-                }
+                return refund_unfulfilled_purchase(userID, ticketID, paymentID,
+                                                   "Ticket is already paid and cannot be updated.")
         except Exception as e:
             logger.error(f"Error calling ticket service: {e}")
             return {"code": 500, "message": f"Error retrieving ticket details: {str(e)}"}
@@ -198,7 +287,7 @@ def process_buy_resale_ticket(userID, ticketID, paymentID):
             original_paymentID = ticket["data"]["paymentID"]
             logger.info(f"Ticket details: sellerID={sellerID}, eventID={eventID}, price={price}, resalePrice={resalePrice}")
 
-            # Get seller's email
+            # Get seller's email; the sellerID is only known from the ticket
             logger.info(f'\n-----Invoking user microservice for seller {sellerID}-----')
             try:
                 seller = invoke_http_with_retry(f"{user_URL}/{sellerID}")
@@ -217,65 +306,49 @@ def process_buy_resale_ticket(userID, ticketID, paymentID):
         logger.info(f'\n-----Updating ticket {ticketID} for user {userID}-----')
         
         # Check ticket conditions before update
+        # The buyer has already paid, so every rejection from here on refunds them
         if ticket['data']['isCheckedIn']:
-            return {
-                "code": 409,
-                "message": "Ticket is already checked in and cannot be modified."
-            }
+            return refund_unfulfilled_purchase(userID, ticketID, paymentID,
+                                               "Ticket is already checked in and cannot be modified.")
             
         if ticket['data']['status'] != 'available':
-            return {
-                "code": 409,
-                "message": f"Ticket cannot be updated. Current status: {ticket['data']['status']}"
-            }
+            return refund_unfulfilled_purchase(userID, ticketID, paymentID,
+                                               f"Ticket cannot be updated. Current status: {ticket['data']['status']}.")
             
+        # Claim the ticket in one conditional update: it only applies if the ticket is still
+        # listed by the same seller, so two buyers cannot both get it
         update_data = {
             "status": "paid",
             "ownerID": userID,
             "ownerName": userName,
             "paymentID": paymentID,
-            "isCheckedIn": False
+            "isCheckedIn": False,
+            "expectedStatus": "available",
+            "expectedOwner": sellerID
         }
         logger.info(f"Update data being sent: {json.dumps(update_data, indent=2)}")
         
         try:
-            reserve_data = {"status": "paid"}
-            reserve_result = invoke_http_with_retry(f"{ticket_URL}/{ticketID}", method='PUT', json=reserve_data)
-            
-            if not isinstance(reserve_result, dict) or reserve_result.get("code") != 200:
-                return {
-                    "code": 500,
-                    "message": f"Failed to reserve ticket: {reserve_result.get('message', 'Unknown error')}"
-                }
-            
-            # Then, update with the full data
-            ticket_result = invoke_http_with_retry(f"{ticket_URL}/{ticketID}", method='PUT', json=update_data)
-            
-            if not isinstance(ticket_result, dict):
-                return {
-                    "code": 500,
-                    "message": f"Invalid response type from ticket update: {type(ticket_result)}"
-                }
-                
-            if ticket_result.get("code") != 200:
-                return {
-                    "code": ticket_result.get("code", 500),
-                    "message": f"Unexpected response code: {ticket_result.get('code')}"
-                }
+            outcome, error = claim_resale_ticket(ticketID, update_data)
+
+            if outcome == "lost":
+                # Another buyer claimed the ticket first
+                return refund_unfulfilled_purchase(userID, ticketID, paymentID,
+                                                   "Ticket is no longer available for resale.")
+
+            if outcome != "claimed":
+                # The buyer may or may not own the ticket now, so the payment is not refunded here
+                logger.error(f"COMPENSATION NEEDED: claim of ticket {ticketID} with payment {paymentID} "
+                             f"of user {userID} has an unknown outcome: {error['message']}")
+                return error
         except Exception as e:
             logger.error(f"Error updating ticket: {e}")
-            # Try to revert the ticket status back to available if the update failed
-            try:
-                revert_data = {"status": "available"}
-                invoke_http_with_retry(f"{ticket_URL}/{ticketID}", method='PUT', json=revert_data)
-            except Exception as revert_error:
-                logger.error(f"Failed to revert ticket status: {revert_error}")
             return {"code": 500, "message": f"Error updating ticket: {str(e)}"}
 
         # Step 8-9: Invoke payment service to refund charge
         logger.info(f'\n-----Invoking payment microservice for refund {original_paymentID}-----')
         try:
-            refund_result = invoke_http_with_retry(
+            invoke_http_with_retry(
                 f"{payment_URL}/makerefund", 
                 method='POST', 
                 json={"payment_intent": original_paymentID}
@@ -284,31 +357,29 @@ def process_buy_resale_ticket(userID, ticketID, paymentID):
             logger.error(f"Error processing refund: {e}")
             return {"code": 500, "message": f"Error processing refund: {str(e)}"}
 
-        # Step 10-11: Log purchase and refund transactions
+        # Step 10-11: Log purchase and refund transactions concurrently
         try:
-            # Create purchase transaction
-            purchase_transactionID = "Trans" + str(uuid.uuid4())[:7]
-            transaction_data = {
-                "transactionID": purchase_transactionID,
+            purchase_transaction = {
+                "transactionID": "Trans" + str(uuid.uuid4())[:7],
                 "type": "purchase",
                 "userID": userID,
                 "ticketID": ticketID,
                 "paymentID": paymentID,
                 "amount": resalePrice
             }
-            invoke_http_with_retry(f"{transaction_URL}", method="POST", json=transaction_data)
-
-            # Create refund transaction
-            refund_transactionID = "Ref" + str(uuid.uuid4())[:7]
-            transaction_data = {
-                "transactionID": refund_transactionID,
+            refund_transaction = {
+                "transactionID": "Ref" + str(uuid.uuid4())[:7],
                 "type": "refund",
                 "userID": sellerID,
                 "ticketID": ticketID,
                 "paymentID": original_paymentID,
                 "amount": resalePrice
             }
-            invoke_http_with_retry(f"{transaction_URL}", method="POST", json=transaction_data)
+            for transaction_result in invoke_many_with_retry([
+                {"url": transaction_URL, "method": "POST", "json": purchase_transaction},
+                {"url": transaction_URL, "method": "POST", "json": refund_transaction},
+            ]):
+                check_service_result(transaction_result)
         except Exception as e:
             logger.error(f"Error creating transactions: {e}")
             return {"code": 500, "message": f"Error creating transactions: {str(e)}"}
@@ -349,7 +420,7 @@ def process_buy_resale_ticket(userID, ticketID, paymentID):
             "code": 201,
             "data": {
                 "ticketID": ticketID,
-                "transactionID": purchase_transactionID,
+                "transactionID": purchase_transaction["transactionID"],
             },
             "message": "Ticket bought successfully."
         }
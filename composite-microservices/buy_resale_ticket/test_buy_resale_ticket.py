@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+
+# The service connects to RabbitMQ when it is imported
+with mock.patch("pika.BlockingConnection"):
+    import buy_resale_ticket
+
+BUYER = {"code": 200, "data": {"name": "Buyer", "email": "buyer@example.com"}}
+SELLER = {"code": 200, "data": {"name": "Seller", "email": "seller@example.com"}}
+TICKET = {
+    "code": 200,
+    "data": {
+        "ticketID": "T1",
+        "ownerID": "U2",
+        "ownerName": "Seller",
+        "eventID": "E1",
+        "eventName": "Concert",
+        "eventDateTime": "2025-06-15T12:00:00",
+        "seatNo": 7,
+        "seatCategory": "Cat 1",
+        "price": 100.0,
+        "resalePrice": 80.0,
+        "status": "available",
+        "paymentID": "pi_seller",
+        "isCheckedIn": False,
+    },
+}
+
+
+class FakeServices:
+    """Answers invoke_http calls of the resale purchase by URL and method, and records them.
+    After the claim PUT, GET /ticket returns ticket_after_claim (by default the listed ticket)."""
+    def __init__(self, claim_reply, ticket_after_claim=None):
+        self.claim_reply = claim_reply
+        self.ticket_after_claim = ticket_after_claim or TICKET
+        self.calls = []
+
+    def claims(self):
+        return [call for call in self.calls if call[0] == "PUT"]
+
+    def __call__(self, url, method="GET", json=None, **kwargs):
+        self.calls.append((method, url, json))
+        if url.endswith("/user/U1"):
+            return BUYER
+        if url.endswith("/user/U2"):
+            return SELLER
+        if url.endswith("/ticket/T1") and method == "GET":
+            return self.ticket_after_claim if self.claims() else TICKET
+        if url.endswith("/ticket/T1") and method == "PUT":
+            return self.claim_reply
+        if url.endswith("/makerefund"):
+            return {"success": True}
+        if url.endswith("/transaction"):
+            return {"code": 201, "data": json}
+        raise AssertionError(f"unexpected call {method} {url}")
+
+    def many(self, calls, deadline=None):
+        return [self(**call) for call in calls]
+
+    def refunds(self):
+        return [json["payment_intent"] for method, url, json in self.calls if url.endswith("/makerefund")]
+
+
+class ProcessBuyResaleTicketTest(unittest.TestCase):
+    def buy(self, claim_reply, ticket_after_claim=None):
+        services = FakeServices(claim_reply, ticket_after_claim)
+        with mock.patch.object(buy_resale_ticket, "invoke_http", services), \
+                mock.patch.object(buy_resale_ticket.time, "sleep"), \
+                mock.patch.object(buy_resale_ticket, "invoke_many", services.many), \
+                mock.patch.object(buy_resale_ticket, "publish_to_rabbitmq") as publish:
+            result = buy_resale_ticket.process_buy_resale_ticket("U1", "T1", "pi_buyer")
+        return result, services, publish
+
+    def test_happy_path_returns_purchase_transaction(self):
+        result, services, publish = self.buy({"code": 200, "data": dict(TICKET["data"], ownerID="U1")})
+
+        self.assertEqual(result["code"], 201, result)
+        self.assertEqual(result["data"]["ticketID"], "T1")
+        purchase = [json for method, url, json in services.calls
+                    if url.endswith("/transaction") and json["type"] == "purchase"]
+        self.assertEqual(result["data"]["transactionID"], purchase[0]["transactionID"])
+        self.assertEqual(services.refunds(), ["pi_seller"])
+        publish.assert_called_once()
+
+    def test_lost_claim_reply_is_not_refunded_or_resent(self):
+        # The claim applied but its reply was lost: the ticket now belongs to the buyer
+        bought = {"code": 200, "data": dict(TICKET["data"], ownerID="U1", status="paid", paymentID="pi_buyer")}
+        result, services, _ = self.buy({"code": 500, "message": "timed out"}, bought)
+
+        self.assertEqual(result["code"], 201, result)
+        self.assertEqual(len(services.claims()), 1)
+        self.assertNotIn("pi_buyer", services.refunds())
+
+    def test_lost_race_refunds_buyer(self):
+        taken = {"code": 200, "data": dict(TICKET["data"], ownerID="U3", status="paid", paymentID="pi_other")}
+        result, services, publish = self.buy(
+            {"code": 409, "data": {"ticketID": "T1", "status": "paid", "ownerID": "U3"}}, taken)
+
+        self.assertEqual(result["code"], 409, result)
+        self.assertTrue(result["data"]["refunded"])
+        self.assertEqual(services.refunds(), ["pi_buyer"])
+        publish.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
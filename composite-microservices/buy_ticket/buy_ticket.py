@@ -5,7 +5,7 @@ import os, sys
 import requests
 import pika
 import json
-from invokes import invoke_http
+from invokes import invoke_http, invoke_many
 import time
 import logging
 
@@ -30,7 +30,9 @@ credentials = pika.PlainCredentials('guest', 'guest')
 event_URL = f"{base_url}/event"
 seat_URL = f"{base_url}/seat"
 ticket_URL = f"{base_url}/ticket"
+tickets_URL = f"{base_url}/tickets"
 transaction_URL = f"{base_url}/transaction"
+transactions_URL = f"{base_url}/transactions"
 user_URL = f"{base_url}/user"
 payment_URL = f"{base_url}/payment"
 email_URL = f"{base_url}/email"
@@ -114,28 +116,18 @@ def buy_ticket():
             eventDateTime = data["eventDateTime"]
             seats = data["seats"]
 
-            # Step 1: Initialize an empty list to store results
-            results = []
+            if not isinstance(seats, list) or not seats:
+                return jsonify({"code": 400, "message": "No seats selected."}), 400
 
-            # Step 2: Iterate through each seat and call process_buy_ticket for each one
-            for seat in seats:
-                seatNo = seat["seatNo"]
-                seatCategory = seat["seatCategory"]
-                price = seat["price"]
-                paymentID = seat["paymentID"]
+            seat_fields = ["seatNo", "seatCategory", "price", "paymentID"]
+            if not all(field in seat for seat in seats for field in seat_fields):
+                return jsonify({"code": 400, "message": "Missing required seat fields."}), 400
 
-                # Step 3: Call process_buy_ticket for each seat
-                result = process_buy_ticket(userID, eventName, eventID, eventDateTime, seatNo, seatCategory, price, paymentID)
+            # Step 1: Buy all seats in one batch
+            result = process_buy_tickets(userID, eventName, eventID, eventDateTime, seats)
 
-                # Collect the result of each ticket purchase
-                results.append(result)
-
-            # Step 4: Return the results of all ticket purchases
-            return jsonify({
-                "code": 200,
-                "data": results,
-                "message": "Ticket purchase successful for all seats."
-            }), 200
+            # Step 2: Return the per-seat results of the purchase
+            return jsonify(result), result["code"]
 
         except Exception as e:
             exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -155,33 +147,28 @@ def buy_ticket():
 
 
 
-def process_buy_ticket(userID, eventName, eventID, eventDateTime, seatNo, seatCategory, price, paymentID):
-    try:
-        # Step 2-3: Update event availableSeats
-        print('\n-----Invoking event microservice-----')
-        event = invoke_http(f"{event_URL}/{eventID}/{eventDateTime}")
-        
-        if not isinstance(event, dict):
-            return {
-                "code": 500,
-                "message": "Invalid response from event microservice."
-            }
-        
-        if event.get("code") not in range(200, 300):
-            return {
-                "code": 500,
-                "message": f"Failed to get event: {event.get('message', 'Unknown error')}"
-            }
+def release_reserved_seats(eventID, eventDateTime, quantity):
+    """Give seats reserved by a failed purchase back to the event date."""
+    release_result = invoke_http(f"{event_URL}/{eventID}/{eventDateTime}/release", method="POST", json={"quantity": quantity})
+    if not isinstance(release_result, dict) or release_result.get("code") not in range(200, 300):
+        logger.error(f"Failed to release {quantity} reserved seats for {eventID} on {eventDateTime}")
 
-        if "data" not in event or "availableSeats" not in event["data"]:
-            return {
-                "code": 500,
-                "message": "Event data not found or unavailable."
-            }
+def process_buy_tickets(userID, eventName, eventID, eventDateTime, seats):
+    """Buy all seats of one order with a fixed number of service calls,
+       regardless of how many seats are in the order:
+       one atomic seat reservation and one user read (sent concurrently),
+       one bulk ticket create and one bulk transaction create.
+    """
+    try:
+        quantity = len(seats)
 
-        availableSeats = event["data"]["availableSeats"]
-        newSeats = availableSeats - 1
-        event_result = invoke_http(f"{event_URL}/{eventID}/{eventDateTime}", method="PUT", json={"availableSeats": newSeats})
+        # Step 2-5: Atomically reserve availableSeats once for the whole order and,
+        # at the same time, get user name and email from userID
+        print('\n-----Invoking event and user microservices-----')
+        event_result, user = invoke_many([
+            {"url": f"{event_URL}/{eventID}/{eventDateTime}/reserve", "method": "POST", "json": {"quantity": quantity}},
+            {"url": f"{user_URL}/{userID}"},
+        ])
 
         if not isinstance(event_result, dict):
             return {
@@ -189,142 +176,152 @@ def process_buy_ticket(userID, eventName, eventID, eventDateTime, seatNo, seatCa
                 "message": "Invalid response from event update."
             }
 
-        if event_result.get("code") not in range(200, 300):
+        if event_result.get("code") == 409:
             return {
-                "code": 500,
-                "message": f"Failed to update event: {event_result.get('message', 'Unknown error')}"
+                "code": 409,
+                "message": event_result.get("message", "Not enough seats left for this event date.")
             }
 
-        # Step 4-5: Get user name and email from userID
-        print('\n-----Invoking user microservice-----')
-        user = invoke_http(f"{user_URL}/{userID}")
-        
-        if not isinstance(user, dict):
+        if event_result.get("code") not in range(200, 300):
             return {
                 "code": 500,
-                "message": "Invalid response from user microservice."
+                "message": f"Failed to update event: {event_result.get('message', 'Unknown error')}"
             }
 
-        if user.get("code") not in range(200, 300):
-            return {
-                "code": 500,
-                "message": f"Failed to get user: {user.get('message', 'Unknown error')}"
-            }
-        
-        if "data" not in user or "name" not in user["data"] or "email" not in user["data"]:
+        # The seats are reserved, so a bad user read must give them back
+        user_error = None
+        if not isinstance(user, dict):
+            user_error = "Invalid response from user microservice."
+        elif user.get("code") not in range(200, 300):
+            user_error = f"Failed to get user: {user.get('message', 'Unknown error')}"
+        elif "data" not in user or "name" not in user["data"] or "email" not in user["data"]:
+            user_error = "User data not found."
+
+        if user_error:
+            release_reserved_seats(eventID, eventDateTime, quantity)
             return {
                 "code": 500,
-                "message": "User data not found."
+                "message": user_error
             }
 
         userName = user["data"]["name"]
         userEmail = user["data"]["email"]
 
-        # Step 6-7: Create new ticket
+        # Step 6-7: Create all tickets in one bulk call
         print('\n-----Invoking ticket microservice-----')
-        ticketID = None
-        for i in range(5):  # max 5 attempts
-            temp_ticketID = "T" + str(uuid.uuid4())[:4]
-            
-            ticket_data = {
+        # The ticket service allocates the ticketIDs and returns them with the created tickets
+        tickets_data = [
+            {
                 "ownerID": userID,
                 "ownerName": userName,
                 "eventID": eventID,
                 "eventName": eventName,
                 "eventDateTime": eventDateTime,
-                "seatNo": seatNo,
-                "seatCategory": seatCategory,
-                "price": price,
+                "seatNo": seat["seatNo"],
+                "seatCategory": seat["seatCategory"],
+                "price": seat["price"],
                 "resalePrice": None,  # Set to None for new tickets
                 "status": "paid",
-                "paymentID": paymentID,
+                "paymentID": seat["paymentID"],
                 "isCheckedIn": False  # Set to False for new tickets
             }
+            for seat in seats
+        ]
 
-            try:
-                logger.info(f"Making request to ticket service: {ticket_URL}/{temp_ticketID}")
-                ticket_result = invoke_http(f"{ticket_URL}/{temp_ticketID}", method="POST", json=ticket_data)
-                
-                if not isinstance(ticket_result, dict):
-                    continue  # Try again with new ticketID
-                
-                if ticket_result.get("code") == 201:
-                    ticketID = temp_ticketID
-                    logger.info(f"Successfully created ticket with ID: {ticketID}")
-                    break
-                else:
-                    logger.error(f"Failed to create ticket: {ticket_result.get('message', 'Unknown error')}")
-                    continue  # Try again with new ticketID
-            except Exception as e:
-                logger.error(f"Exception during ticket creation: {str(e)}")
-                continue  # Try again with new ticketID
+        logger.info(f"Making request to ticket service: {tickets_URL} ({quantity} tickets)")
+        ticket_result = invoke_http(tickets_URL, method="POST", json={"tickets": tickets_data})
 
-        if ticketID is None:
+        if not isinstance(ticket_result, dict) or ticket_result.get("code") != 201:
+            message = ticket_result.get("message", "Unknown error") if isinstance(ticket_result, dict) else ticket_result
+            logger.error(f"Failed to create tickets: {message}")
+            release_reserved_seats(eventID, eventDateTime, quantity)
             return {
                 "code": 500,
-                "message": "Failed to create ticket after multiple attempts."
+                "message": f"Failed to create tickets: {message}"
             }
 
-        # Step 8-9: Create new transaction
-        print('\n-----Invoking transaction microservice-----')
-        transaction_code = None
-        while transaction_code == None or transaction_code == 409:  # rare conflict case
-            transactionID = "Trans" + str(uuid.uuid4())[:7]
+        tickets_data = ticket_result["data"]["tickets"]
+        logger.info(f"Successfully created tickets: {[ticket['ticketID'] for ticket in tickets_data]}")
 
-            transaction_data = {
-                "transactionID": transactionID,
+        # Step 8-9: Create all transactions in one bulk call
+        print('\n-----Invoking transaction microservice-----')
+        transactions_data = [
+            {
+                "transactionID": "Trans" + str(uuid.uuid4())[:7],
                 "type": "purchase",
                 "userID": userID,
-                "ticketID": ticketID,
-                "paymentID": paymentID,
-                "amount": price
+                "ticketID": ticket["ticketID"],
+                "paymentID": ticket["paymentID"],
+                "amount": ticket["price"]
             }
+            for ticket in tickets_data
+        ]
 
-            transaction_result = invoke_http(f"{transaction_URL}", method="POST", json=transaction_data)
+        transaction_code = None
+        for i in range(5):  # max 5 attempts, 409 is a rare conflict case
+            transaction_result = invoke_http(transactions_URL, method="POST", json={"transactions": transactions_data})
             
             if not isinstance(transaction_result, dict):
-                continue  # Try again with new transactionID
+                continue  # Try again
                 
             transaction_code = transaction_result.get("code")
+            if transaction_code != 409:
+                break
+
+            conflicts = set(transaction_result.get("data", {}).get("transactionIDs", []))
+            for transaction in transactions_data:
+                if transaction["transactionID"] in conflicts:
+                    transaction["transactionID"] = "Trans" + str(uuid.uuid4())[:7]
+
+        if transaction_code != 201:
+            logger.error(f"Failed to create transactions, last code: {transaction_code}")
 
         # Step 10: Email buyer asynchronously
         print('\n-----Invoking email service through AMQP-----')
-        payload = {
-            "user_id": userID,
-            "user_name": userName,
-            "user_email": userEmail,
-            "ticket_id": ticketID,
-            "event_id": eventID,
-            "event_name": eventName,
-            "event_date": eventDateTime,
-            "seat_no": seatNo,
-            "seat_category": seatCategory,
-            "price": price
-        }
+        for ticket in tickets_data:
+            payload = {
+                "user_id": userID,
+                "user_name": userName,
+                "user_email": userEmail,
+                "ticket_id": ticket["ticketID"],
+                "event_id": eventID,
+                "event_name": eventName,
+                "event_date": eventDateTime,
+                "seat_no": ticket["seatNo"],
+                "seat_category": ticket["seatCategory"],
+                "price": ticket["price"]
+            }
 
-        try:
-            publish_to_rabbitmq(
-                exchange="ticketing",
-                routing_key="ticket.purchased",
-                body=payload
-            )
-        except Exception as e:
-            logger.error(f"Failed to publish email notification: {e}")
-            # Don't fail the whole transaction if email fails
-            pass
+            try:
+                publish_to_rabbitmq(
+                    exchange="ticketing",
+                    routing_key="ticket.purchased",
+                    body=payload
+                )
+            except Exception as e:
+                logger.error(f"Failed to publish email notification: {e}")
+                # Don't fail the whole transaction if email fails
+                pass
 
         return {
-            "code": 201,
-            "data": {
-                "ticketID": ticketID,
-                "transactionID": transactionID
-            },
-            "message": "Ticket purchase successful."
+            "code": 200,
+            "data": [
+                {
+                    "code": 201,
+                    "data": {
+                        "ticketID": ticket["ticketID"],
+                        "transactionID": transaction["transactionID"]
+                    },
+                    "message": "Ticket purchase successful."
+                }
+                for ticket, transaction in zip(tickets_data, transactions_data)
+            ],
+            "message": "Ticket purchase successful for all seats."
         }
     except Exception as e:
         return {
             "code": 500,
-            "message": f"Error processing ticket: {str(e)}"
+            "message": f"Error processing tickets: {str(e)}"
         }
 
 if __name__ == "__main__":
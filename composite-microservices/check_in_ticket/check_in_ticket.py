@@ -1,15 +1,29 @@
-from flask import Flask, request, jsonify, send_file, make_response, render_template
+from flask import Flask, request, jsonify, send_file, make_response, render_template, Response
 from flask_cors import CORS
 import os, sys
 import segno
 import uuid
 import requests
 from io import BytesIO
-from invokes import invoke_http
+from invokes import invoke_http, post_graphql
 import base64
+import hashlib
+import hmac
+import threading
+from array import array
+import json
+import time
+import pika
+from datetime import datetime, timezone
+import tempfile
+from collections import OrderedDict
+from dotenv import load_dotenv
 
 import socket
 
+# Load environment variables from .env file
+load_dotenv()
+
 # Prioritize HOST_IP from environment variable, fallback to local IP detection
 HOST_IP = os.environ.get('HOST_IP')
 if not HOST_IP:
@@ -29,9 +43,267 @@ CORS(app)
 kong_base_url = "http://kong:8000"
 ticket_URL = f"{kong_base_url}/ticket"
 graphql_URL = f"{kong_base_url}/graphql"
+tickets_checkin_URL = f"{kong_base_url}/tickets/checkin"
+roster_URL = f"{kong_base_url}/tickets/roster"
+
+# QR payloads are signed with the same secret the user and ticket services use for JWTs.
+# The placeholder default is public, so it is never used to sign or verify: without a real
+# JWT_SECRET_KEY, QR codes are issued unsigned and any token on a scan is ignored.
+DEFAULT_JWT_SECRET_KEY = "your_default_super_secret_key"
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
+QR_SIGNING_KEY = JWT_SECRET_KEY.encode() if JWT_SECRET_KEY and JWT_SECRET_KEY != DEFAULT_JWT_SECRET_KEY else None
+# Reject scans of unsigned QR codes (only issued before signing was introduced);
+# on by default whenever QR codes can be signed
+REQUIRE_SIGNED_QR = os.environ.get("REQUIRE_SIGNED_QR", "true" if QR_SIGNING_KEY else "false").lower() == "true"
+if QR_SIGNING_KEY is None:
+    if REQUIRE_SIGNED_QR:
+        sys.exit("REQUIRE_SIGNED_QR is set but JWT_SECRET_KEY is missing or the public default; refusing to start.")
+    print("WARNING: JWT_SECRET_KEY is missing or the public default. QR codes are NOT signed and "
+          "scans are not verified; set JWT_SECRET_KEY to enable signed QR codes.")
+# When set, this gate only admits tickets for this event
+GATE_EVENT_ID = os.environ.get("GATE_EVENT_ID")
+# When set together with GATE_EVENT_ID, that event date's roster is loaded at startup
+GATE_EVENT_DATETIME = os.environ.get("GATE_EVENT_DATETIME")
+# How often check-ins admitted from a roster are written back to the ticket service
+ROSTER_FLUSH_INTERVAL_SECONDS = float(os.environ.get("ROSTER_FLUSH_INTERVAL_SECONDS", "1"))
+
+# Rendered QR images: in-memory LRU, plus a content-addressed directory shared across
+# restarts when QR_CACHE_DIR is set
+QR_CACHE_MAX_ENTRIES = int(os.environ.get('QR_CACHE_MAX_ENTRIES', '2000'))
+QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR')
+QR_DEFAULT_SCALE = 10
+QR_MAX_SCALE = 20
+QR_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
+RABBITMQ_PORT = 5672
+RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
+RABBITMQ_PASS = os.environ.get('RABBITMQ_PASS', 'guest')
+# ticket.checkedin events only matter to status waiters for a short while
+CHECKIN_EVENT_TTL_MS = 60000
+CHECKIN_RECENT_MAX_ENTRIES = 50000
+# Status waits: SSE streams end after STATUS_STREAM_SECONDS (EventSource reconnects by itself)
+STATUS_STREAM_SECONDS = 300
+STATUS_KEEPALIVE_SECONDS = 15
+STATUS_LONG_POLL_MAX_SECONDS = 30
+
+class CheckInNotifier:
+    """Wakes status waiters when a ticket is checked in.
+
+    Waiters block on a per-ticket threading.Event, so a check-in only wakes the waiters of
+    that ticket. Recently checked-in ticketIDs are remembered (bounded) so a waiter that
+    arrives after the event still sees it.
+    """
+    def __init__(self, max_recent):
+        self.max_recent = max_recent
+        self.recent = OrderedDict()
+        self.waiters = {}  # ticketID -> [threading.Event, number of waiters]
+        self.lock = threading.Lock()
+
+    def is_checked_in(self, ticketID):
+        with self.lock:
+            return ticketID in self.recent
+
+    def notify(self, ticketID):
+        with self.lock:
+            self.recent[ticketID] = True
+            self.recent.move_to_end(ticketID)
+            while len(self.recent) > self.max_recent:
+                self.recent.popitem(last=False)
+            waiter = self.waiters.get(ticketID)
+        if waiter:
+            waiter[0].set()
+
+    def wait(self, ticketID, timeout):
+        """True as soon as ticketID is checked in, False after timeout seconds."""
+        with self.lock:
+            if ticketID in self.recent:
+                return True
+            waiter = self.waiters.setdefault(ticketID, [threading.Event(), 0])
+            waiter[1] += 1
+        try:
+            return waiter[0].wait(timeout)
+        finally:
+            with self.lock:
+                waiter[1] -= 1
+                if waiter[1] == 0:
+                    del self.waiters[ticketID]
+
+notifier = CheckInNotifier(CHECKIN_RECENT_MAX_ENTRIES)
+
+class CheckInEvents:
+    """ticket.checkedin events over RabbitMQ, so a scan on one check-in replica reaches status
+    waiters on every replica.
+
+    One thread owns the connection: it consumes ticket.checkedin through an exclusive
+    queue (one per replica) into the notifier, and publishes on behalf of request threads
+    via add_callback_threadsafe, since pika connections are not thread-safe.
+    """
+    def __init__(self):
+        self.connection = None
+        self.channel = None
+
+    def run(self):
+        while True:
+            try:
+                credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+                parameters = pika.ConnectionParameters(host=RABBITMQ_HOST, port=RABBITMQ_PORT,
+                                                       credentials=credentials, heartbeat=60)
+                connection = pika.BlockingConnection(parameters)
+                channel = connection.channel()
+                channel.exchange_declare(exchange='ticketing', exchange_type='topic', durable=True)
+                queue = channel.queue_declare(queue='', exclusive=True).method.queue
+                channel.queue_bind(exchange='ticketing', queue=queue, routing_key='ticket.checkedin')
+                channel.basic_consume(queue=queue, on_message_callback=self.on_message, auto_ack=True)
+                self.connection, self.channel = connection, channel
+                print("Listening for ticket.checkedin events")
+                channel.start_consuming()
+            except Exception as e:
+                print(f"RabbitMQ connection for check-in events lost: {e}. Reconnecting in 5s")
+                self.connection = None
+                time.sleep(5)
+
+    def on_message(self, channel, method, properties, body):
+        try:
+            ticketID = json.loads(body)["ticketID"]
+            notifier.notify(ticketID)
+            rosters.mark_checked_in(ticketID)
+        except (ValueError, KeyError) as e:
+            print(f"Ignoring malformed ticket.checkedin event {body!r}: {e}")
+
+    def publish(self, ticketID):
+        """Wake local waiters at once and broadcast the check-in; False if it could not be sent."""
+        notifier.notify(ticketID)
+        connection = self.connection
+        if connection is None or not connection.is_open:
+            print(f"Warning: RabbitMQ unavailable, ticket.checkedin for {ticketID} only reached this replica")
+            return False
+
+        body = json.dumps({"ticketID": ticketID, "checkedInAt": datetime.now(timezone.utc).isoformat()})
+        properties = pika.BasicProperties(content_type='application/json', expiration=str(CHECKIN_EVENT_TTL_MS))
+        try:
+            connection.add_callback_threadsafe(lambda: self.channel.basic_publish(
+                exchange='ticketing', routing_key='ticket.checkedin', body=body, properties=properties))
+            return True
+        except Exception as e:
+            print(f"Warning: failed to publish ticket.checkedin for {ticketID}: {e}")
+            return False
+
+checkin_events = CheckInEvents()
+
+class Roster:
+    """Check-in state of every ticket of one event date, in compact form: a ticketID -> row
+    dict over an int array of seat numbers, interned status strings and a bytearray of
+    checked-in flags."""
+    def __init__(self, data):
+        self.eventID = data["eventID"]
+        self.eventDateTime = data["eventDateTime"]
+        self.rows = {ticketID: row for row, ticketID in enumerate(data["ticketIDs"])}
+        self.seatNos = array('i', (seatNo or 0 for seatNo in data["seatNos"]))
+        self.statuses = [sys.intern(status or "") for status in data["statuses"]]
+        self.checkedIn = bytearray(1 if checkedIn else 0 for checkedIn in data["checkedIn"])
+
+class Rosters:
+    """Pre-loaded rosters that answer status checks and admit scans locally.
+
+    Check-ins admitted here are queued and written back to the ticket service in batches
+    (POST /tickets/checkin) by a background thread; failed batches are retried. Check-ins
+    made elsewhere reach the roster through ticket.checkedin events. A roster only admits
+    a ticket once, but two replicas holding the same roster could each admit it before
+    hearing of the other, so give each event date's gates a single check-in node.
+    """
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.rosters = {}  # (eventID, eventDateTime) -> Roster
+        self.pending = []  # ticketIDs admitted locally, not yet written back
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def load(self, eventID, eventDateTime):
+        """Fetch an event date's roster (one bulk read in the ticket service) and start serving it.
+        Reloading keeps every check-in the roster being replaced already knows of."""
+        result = invoke_http(f"{roster_URL}/{eventID}/{eventDateTime}", method='GET')
+        if not isinstance(result, dict) or result.get("code") != 200:
+            message = result.get("message", "Unknown error") if isinstance(result, dict) else "Invalid response."
+            raise RuntimeError(f"Failed to load roster for {eventID} {eventDateTime}: {message}")
+        roster = Roster(result["data"])
+        with self.lock:
+            previous = self.rosters.get((eventID, eventDateTime))
+            if previous is not None:
+                # Check-ins only ever go one way, and the old roster also holds those admitted here
+                # but not yet written back (pending or in a batch being flushed) and those heard of
+                # while the new roster was being read: keep them all, or they could be admitted twice
+                for ticketID, old_row in previous.rows.items():
+                    row = roster.rows.get(ticketID)
+                    if row is not None and previous.checkedIn[old_row]:
+                        roster.checkedIn[row] = 1
+            self.rosters[(eventID, eventDateTime)] = roster
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run, daemon=True)
+                self.flusher.start()
+        print(f"Loaded roster for {eventID} {eventDateTime}: {len(roster.rows)} tickets")
+        return roster
+
+    def locate(self, ticketID):
+        for roster in list(self.rosters.values()):
+            row = roster.rows.get(ticketID)
+            if row is not None:
+                return roster, row
+        return None, None
+
+    def is_checked_in(self, ticketID):
+        """True / False from the roster, None if no loaded roster has the ticket."""
+        roster, row = self.locate(ticketID)
+        return None if roster is None else bool(roster.checkedIn[row])
+
+    def check_in(self, ticketID):
+        """Admit a ticket locally: "checked_in", "already_checked_in", or None if not in a roster."""
+        with self.lock:
+            roster, row = self.locate(ticketID)
+            if roster is None:
+                return None
+            if roster.checkedIn[row]:
+                return "already_checked_in"
+            roster.checkedIn[row] = 1
+            self.pending.append(ticketID)
+            return "checked_in"
+
+    def mark_checked_in(self, ticketID):
+        with self.lock:
+            roster, row = self.locate(ticketID)
+            if roster is not None:
+                roster.checkedIn[row] = 1
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return
+        result = invoke_http(tickets_checkin_URL, method='POST', json={"ticketIDs": batch})
+        if not isinstance(result, dict) or result.get("code") != 200:
+            with self.lock:
+                self.pending = batch + self.pending
+            raise RuntimeError(result.get("message", "Unknown error") if isinstance(result, dict) else "Invalid response.")
+        if result["data"]["alreadyCheckedIn"]:
+            print(f"Warning: tickets admitted here were already checked in elsewhere: {result['data']['alreadyCheckedIn']}")
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Roster write-back failed, will retry: {e}")
+
+rosters = Rosters(ROSTER_FLUSH_INTERVAL_SECONDS)
 
 # Function to check if the ticket is checked in using GraphQL
 def is_ticket_checked_in(ticketID):
+    # Served from a pre-loaded roster when the ticket is in one
+    checked_in = rosters.is_checked_in(ticketID)
+    if checked_in is not None:
+        return checked_in
+
     query = """
     query GetTicketStatus($ticketID: String!) {
         isCheckedIn(ticketID: $ticketID)
@@ -40,7 +312,7 @@ def is_ticket_checked_in(ticketID):
     variables = {"ticketID": ticketID}
     print(f'\n-----Invoking GraphQL endpoint for status check: {graphql_URL}-----\n')
     try:
-        response = requests.post(f"{graphql_URL}", json={'query': query, 'variables': variables})
+        response = post_graphql(graphql_URL, query, variables)
         response.raise_for_status() # Raise an exception for bad status codes
 
         data = response.json()
@@ -67,28 +339,176 @@ def is_ticket_checked_in(ticketID):
         print("Error decoding GraphQL JSON response")
         return False
 
-@app.route('/generateqr/<string:ticketID>', methods=['GET'])
-def generate_qr_code_route(ticketID):
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def b64url_decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def sign_payload(payload):
+    """Token "<payload>.<signature>": compact JSON, base64url, and a 128-bit HMAC-SHA256 of it.
+    Empty when signing is disabled (no JWT_SECRET_KEY)."""
+    if QR_SIGNING_KEY is None:
+        return ""
+    encoded = b64url(json.dumps(payload, separators=(",", ":"), sort_keys=True).encode())
+    signature = hmac.new(QR_SIGNING_KEY, encoded.encode(), hashlib.sha256).digest()[:16]
+    return f"{encoded}.{b64url(signature)}"
+
+def verify_scan(ticketID, token):
+    """Check a scanned QR token locally, without any service call.
+       return: None if the ticket may be checked in, otherwise the reason it is rejected
+    """
+    if QR_SIGNING_KEY is None:
+        # Signing is disabled, so a token cannot be trusted either way
+        return None
+    if not token:
+        return "unsigned QR code" if REQUIRE_SIGNED_QR else None
     try:
-        # Use HOST_IP (env var or detected) to construct full scan URL
-        # This URL is what the phone will open
-        scan_url = f"http://{HOST_IP}:5103/scanqr/{ticketID}"
-        print(f"Generating QR code for URL: {scan_url}")
+        encoded, signature = token.split(".")
+        expected = hmac.new(QR_SIGNING_KEY, encoded.encode(), hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(b64url_decode(signature), expected):
+            return "invalid signature"
+        payload = json.loads(b64url_decode(encoded))
+    except ValueError:
+        return "malformed QR code"
+    if payload.get("t") != ticketID:
+        return "QR code belongs to another ticket"
+    if GATE_EVENT_ID and payload.get("e") != GATE_EVENT_ID:
+        return "ticket is for another event"
+    return None
+
+class TicketTokens:
+    """Signed QR tokens by ticketID. A token only covers fields that never change for a ticket
+    (ticketID, event, date, seat), so one ticket lookup per ticketID is enough."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, ticketID):
+        """The ticket's token ("" when signing is disabled), or None if the ticket does not exist."""
+        with self.lock:
+            token = self.tokens.get(ticketID)
+            if token is not None:
+                self.tokens.move_to_end(ticketID)
+                return token
+
+        ticket = invoke_http(f"{ticket_URL}/{ticketID}", method='GET')
+        if not isinstance(ticket, dict) or ticket.get("code") != 200:
+            return None
+        data = ticket["data"]
+        token = sign_payload({"t": ticketID, "e": data["eventID"], "d": data["eventDateTime"], "s": data["seatNo"]})
+        with self.lock:
+            self.tokens[ticketID] = token
+            while len(self.tokens) > self.max_entries:
+                self.tokens.popitem(last=False)
+        return token
+
+ticket_tokens = TicketTokens(QR_CACHE_MAX_ENTRIES)
+
+def qr_scan_url(ticketID):
+    # Use HOST_IP (env var or detected) to construct full scan URL
+    # This URL is what the phone will open; t is the signed ticket payload
+    token = ticket_tokens.get(ticketID)
+    if token is None:
+        raise LookupError(f"Ticket {ticketID} not found")
+    if not token:
+        return f"http://{HOST_IP}:5103/scanqr/{ticketID}"
+    return f"http://{HOST_IP}:5103/scanqr/{ticketID}?t={token}"
+
+def qr_key(ticketID, kind="png", scale=QR_DEFAULT_SCALE):
+    """Content address of a QR image: hash of everything that determines its bytes."""
+    return hashlib.sha256(f"{qr_scan_url(ticketID)}|{kind}|{scale}".encode()).hexdigest()
+
+class QRCache:
+    """Bounded LRU of rendered QR images, backed by an optional on-disk store."""
+    def __init__(self, max_entries, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, key, kind):
+        return os.path.join(self.directory, key[:2], f"{key}.{kind}")
+
+    def get(self, key, kind):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                return image
+        if self.directory:
+            try:
+                with open(self.path(key, kind), 'rb') as f:
+                    image = f.read()
+                self.put(key, kind, image, write_disk=False)
+                return image
+            except FileNotFoundError:
+                pass
+        return None
+
+    def put(self, key, kind, image, write_disk=True):
+        with self.lock:
+            self.images[key] = image
+            self.images.move_to_end(key)
+            while len(self.images) > self.max_entries:
+                self.images.popitem(last=False)
+        if self.directory and write_disk:
+            path = self.path(key, kind)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temporary file first so readers never see a partial image
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                    f.write(image)
+                os.replace(f.name, path)
+            except OSError as e:
+                print(f"Warning: could not write QR image to {path}: {e}")
 
-        # Generate QR code using segno
-        qr = segno.make(scan_url)
+qr_cache = QRCache(QR_CACHE_MAX_ENTRIES, QR_CACHE_DIR)
 
-        # Create a BytesIO object to store the PNG data
+def render_qr(ticketID, kind, scale):
+    """Rendered QR image bytes, from the cache when available."""
+    key = qr_key(ticketID, kind, scale)
+    image = qr_cache.get(key, kind)
+    if image is None:
+        scan_url = qr_scan_url(ticketID)
+        print(f"Generating QR code for URL: {scan_url}")
         img_io = BytesIO()
-        qr.save(img_io, kind='png', scale=10)  # Scale up for better visibility
-        img_io.seek(0)
+        if kind == "svg":
+            segno.make(scan_url).save(img_io, kind='svg', scale=scale, xmldecl=False, svgclass=None, lineclass=None)
+        else:
+            # segno writes 1-bit greyscale PNGs, the smallest form for a black and white code
+            segno.make(scan_url).save(img_io, kind='png', scale=scale)
+        image = img_io.getvalue()
+        qr_cache.put(key, kind, image)
+    return key, image
+
+@app.route('/generateqr/<string:ticketID>', methods=['GET'])
+def generate_qr_code_route(ticketID):
+    '''QR code image for a ticket.
+       query params (optional): format ("png" (default) or "svg"), scale (pixels per module, 1-20,
+       default 10), v (the image's content hash, as linked by display_qr; makes it cacheable forever)
+    '''
+    kind = request.args.get('format', 'png')
+    scale = request.args.get('scale', QR_DEFAULT_SCALE, type=int)
+    if kind not in QR_MIMETYPES or not 1 <= scale <= QR_MAX_SCALE:
+        return jsonify({"error": f"format must be png or svg and scale between 1 and {QR_MAX_SCALE}"}), 400
 
-        # Send the image file directly
-        response = make_response(send_file(img_io, mimetype='image/png'))
-        # Allow browser caching for a short time if needed, but maybe not for unique tickets
-        # response.headers['Cache-Control'] = 'public, max-age=60'
-        return response
+    try:
+        key, image = render_qr(ticketID, kind, scale)
+
+        response = make_response(image)
+        response.mimetype = QR_MIMETYPES[kind]
+        response.set_etag(key)
+        if request.args.get('v') == key:
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            # The scan URL embeds HOST_IP, so unversioned URLs are revalidated against the ETag
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
 
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         print(f"Error generating QR code: {str(e)}")
         return jsonify({"error": "Failed to generate QR code", "details": str(e)}), 500
@@ -99,56 +519,172 @@ def display_qr(ticketID):
     if is_ticket_checked_in(ticketID):
          return render_template('already_checked_in.html', ticketID=ticketID) # Or redirect to success
 
+    try:
+        qr_version = qr_key(ticketID)
+    except LookupError:
+        return render_template('scan_result.html', message=f"Ticket {ticketID} not found."), 404
+
     # Pass ticketID to the template for use in JS and image source
-    return render_template('display_qr.html', ticketID=ticketID)
+    return render_template('display_qr.html', ticketID=ticketID, qr_version=qr_version)
 
 @app.route("/scanqr/<string:ticketID>", methods=['GET'])
 def on_qr_scanned(ticketID):
     print(f'\n-----Received QR scan for ticket: {ticketID}-----')
-    
-    # Check initial status
-    initially_checked_in = is_ticket_checked_in(ticketID)
 
-    if initially_checked_in:
-        print(f'Ticket {ticketID} was already checked in.')
+    # Validate the signed QR payload locally
+    rejection = verify_scan(ticketID, request.args.get('t'))
+    if rejection:
+        print(f'Rejected scan of ticket {ticketID}: {rejection}')
+        return render_template('scan_result.html', message=f"Ticket {ticketID} rejected: {rejection}."), 403
+
+    # Tickets of a pre-loaded roster are admitted locally and written back in batches
+    local = rosters.check_in(ticketID)
+    if local == "checked_in":
+        checkin_events.publish(ticketID)
+        return render_template('scan_result.html', message=f"Ticket {ticketID} checked in successfully!")
+    elif local == "already_checked_in":
         return render_template('scan_result.html', message=f"Ticket {ticketID} was already checked in.")
-    else:
-        print(f'Ticket {ticketID} is not checked in yet. Attempting update...')
-        print(f'\n-----Invoking ticket microservice to check-in: {ticket_URL}/{ticketID}-----')
-        try:
-            # Using the PUT request as per the original file's logic
-            update_payload = {"isCheckedIn": True}
-            response_data = invoke_http(f"{ticket_URL}/{ticketID}", method='PUT', json=update_payload)
-            print(f"Ticket service update response: {response_data}")
-
-            # Check if the update call was successful
-            if isinstance(response_data, dict) and response_data.get("code") in range(200, 300):
-                 print(f"Ticket {ticketID} successfully checked in via API.")
-                 # Confirm check-in status *after* successful update if needed, 
-                 # but for now, assume success means checked in.
-                 return render_template('scan_result.html', message=f"Ticket {ticketID} checked in successfully!")
-            else:
-                print(f"Failed to update ticket {ticketID} status via API.")
-                error_detail = response_data.get("message", "Update failed.") if isinstance(response_data, dict) else "Invalid response."
-                return render_template('scan_result.html', message=f"Failed to check in ticket {ticketID}. Error: {error_detail}"), 500
 
-        except Exception as e:
-            print(f"Error during ticket update invocation: {e}")
-            return render_template('scan_result.html', message=f"A server error occurred while checking in ticket {ticketID}."), 500
+    # One conditional update: only succeeds if the ticket is not checked in yet, so a ticket
+    # scanned at two gates at once is only admitted once
+    print(f'\n-----Invoking ticket microservice to check-in: {ticket_URL}/{ticketID}-----')
+    try:
+        update_payload = {"isCheckedIn": True, "expectedCheckedIn": False}
+        response_data = invoke_http(f"{ticket_URL}/{ticketID}", method='PUT', json=update_payload)
+        print(f"Ticket service update response: {response_data}")
+
+        code = response_data.get("code") if isinstance(response_data, dict) else None
+        if code in range(200, 300):
+            print(f"Ticket {ticketID} successfully checked in via API.")
+            checkin_events.publish(ticketID)
+            return render_template('scan_result.html', message=f"Ticket {ticketID} checked in successfully!")
+        elif code == 409:
+            print(f'Ticket {ticketID} was already checked in.')
+            return render_template('scan_result.html', message=f"Ticket {ticketID} was already checked in.")
+        elif code == 404:
+            return render_template('scan_result.html', message=f"Ticket {ticketID} not found."), 404
+        else:
+            print(f"Failed to update ticket {ticketID} status via API.")
+            error_detail = response_data.get("message", "Update failed.") if isinstance(response_data, dict) else "Invalid response."
+            return render_template('scan_result.html', message=f"Failed to check in ticket {ticketID}. Error: {error_detail}"), 500
+
+    except Exception as e:
+        print(f"Error during ticket update invocation: {e}")
+        return render_template('scan_result.html', message=f"A server error occurred while checking in ticket {ticketID}."), 500
+
+@app.route("/scans", methods=['POST'])
+def upload_scans():
+    '''Batch upload of scans buffered at a gate (e.g. while offline).
+       json body: {"scans": [{"ticketID": ..., "t": <signed QR payload>}, ...]}
+       return: one result per scan, in order, with status "checked_in", "already_checked_in",
+       "not_found" or "rejected" (with a reason)
+    '''
+    data = request.get_json(silent=True)
+    scans = data.get("scans") if isinstance(data, dict) else None
+    if not isinstance(scans, list) or not scans or not all(isinstance(scan, dict) and scan.get("ticketID") for scan in scans):
+        return jsonify({"code": 400, "message": "Request body must contain a non-empty 'scans' list of {ticketID, t}."}), 400
+
+    # Signatures are checked locally; scans of roster tickets are admitted locally and the
+    # rest go to the ticket service in one call
+    rejections = [verify_scan(scan["ticketID"], scan.get("t")) for scan in scans]
+    outcome = {}
+    for scan, rejection in zip(scans, rejections):
+        if not rejection and scan["ticketID"] not in outcome:
+            local = rosters.check_in(scan["ticketID"])
+            if local:
+                outcome[scan["ticketID"]] = local
+                if local == "checked_in":
+                    checkin_events.publish(scan["ticketID"])
+    valid = [scan["ticketID"] for scan, rejection in zip(scans, rejections)
+             if not rejection and scan["ticketID"] not in outcome]
+    if valid:
+        result = invoke_http(tickets_checkin_URL, method='POST', json={"ticketIDs": valid})
+        if not isinstance(result, dict) or result.get("code") != 200:
+            message = result.get("message", "Unknown error") if isinstance(result, dict) else "Invalid response."
+            return jsonify({"code": 500, "message": f"Failed to check in scans: {message}"}), 500
+        for status, key in (("checked_in", "checkedIn"), ("already_checked_in", "alreadyCheckedIn"), ("not_found", "notFound")):
+            for ticketID in result["data"][key]:
+                outcome[ticketID] = status
+        for ticketID in result["data"]["checkedIn"]:
+            checkin_events.publish(ticketID)
+
+    results = []
+    admitted = set()
+    for scan, rejection in zip(scans, rejections):
+        ticketID = scan["ticketID"]
+        if rejection:
+            results.append({"ticketID": ticketID, "status": "rejected", "reason": rejection})
+        elif outcome[ticketID] == "checked_in" and ticketID in admitted:
+            results.append({"ticketID": ticketID, "status": "already_checked_in"})  # repeated in this batch
+        else:
+            admitted.add(ticketID)
+            results.append({"ticketID": ticketID, "status": outcome[ticketID]})
+
+    return jsonify({"code": 200, "data": {"results": results}}), 200
 
 @app.route("/checkstatus/<string:ticketID>", methods=['GET'])
 def check_status(ticketID):
+    '''query param wait (optional, seconds, max 30): long-poll, answering as soon as the ticket
+       is checked in or after wait seconds
+    '''
     print(f"Polling status for ticket: {ticketID}") # Add log for polling
-    if is_ticket_checked_in(ticketID):
+    wait = min(request.args.get('wait', 0, type=float), STATUS_LONG_POLL_MAX_SECONDS)
+    checked_in = notifier.is_checked_in(ticketID) or is_ticket_checked_in(ticketID)
+    if not checked_in and wait > 0:
+        checked_in = notifier.wait(ticketID, wait)
+
+    if checked_in:
         return jsonify({"status": "checked_in"})
     else:
         return jsonify({"status": "not_yet"})
 
+@app.route("/checkstatus/<string:ticketID>/stream", methods=['GET'])
+def stream_status(ticketID):
+    '''Server-Sent Events: a "status" event with {"status": "not_yet"} on connect, then
+       {"status": "checked_in"} once the ticket is scanned (on any replica)
+    '''
+    def generate():
+        checked_in = notifier.is_checked_in(ticketID) or is_ticket_checked_in(ticketID)
+        deadline = time.monotonic() + STATUS_STREAM_SECONDS
+        yield "retry: 3000\n\n"
+        if not checked_in:
+            yield f"event: status\ndata: {json.dumps({'status': 'not_yet'})}\n\n"
+        while not checked_in and time.monotonic() < deadline:
+            checked_in = notifier.wait(ticketID, STATUS_KEEPALIVE_SECONDS)
+            if not checked_in:
+                yield ": keepalive\n\n"
+        if checked_in:
+            yield f"event: status\ndata: {json.dumps({'status': 'checked_in'})}\n\n"
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # no proxy buffering of the stream
+    return response
+
+@app.route("/roster/<string:eventID>/<path:eventDateTime>", methods=['POST'])
+def warm_roster(eventID, eventDateTime):
+    '''Pre-load an event date's roster before doors open (reloads it if already loaded)'''
+    try:
+        roster = rosters.load(eventID, eventDateTime)
+    except RuntimeError as e:
+        return jsonify({"code": 500, "message": str(e)}), 500
+    return jsonify({
+        "code": 200,
+        "data": {"eventID": eventID, "eventDateTime": eventDateTime, "tickets": len(roster.rows),
+                 "checkedIn": sum(roster.checkedIn)}
+    }), 200
+
 @app.route("/success")
 def success_page():
     return render_template('success.html')
 
 if __name__ == "__main__":
     print("Starting Flask app...")
+    threading.Thread(target=checkin_events.run, daemon=True).start()
+    if GATE_EVENT_ID and GATE_EVENT_DATETIME:
+        try:
+            rosters.load(GATE_EVENT_ID, GATE_EVENT_DATETIME)
+        except RuntimeError as e:
+            print(f"Warning: {e}. Scans will go to the ticket service.")
     # Make sure host is '0.0.0.0' to be accessible externally
     app.run(host='0.0.0.0', port=5103, debug=True) # Debug=True helps development
\ No newline at end of file
@@ -1,28 +1,65 @@
+import hashlib
+import os
+import random
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 SUPPORTED_HTTP_METHODS = set([
     "GET", "OPTIONS", "HEAD", "POST", "PUT", "PATCH", "DELETE"
 ])
 
-def invoke_http(url, method='GET', json=None, **kwargs):
+# Connection pool and timeouts shared by every call from this service
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))  # kept-alive connections per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+RETRY_STATUS_CODES = {502, 503, 504}
+HTTP_FANOUT_WORKERS = int(os.getenv("HTTP_FANOUT_WORKERS", "16"))  # concurrent calls across all invoke_many
+
+# One Session for the whole process: connections to Kong are kept alive and reused
+# instead of paying a TCP handshake on every call
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_MAXSIZE)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+fanout_executor = ThreadPoolExecutor(max_workers=HTTP_FANOUT_WORKERS, thread_name_prefix="invoke_many")
+
+def invoke_http(url, method='GET', json=None, timeout=None, retries=0, backoff=0.2, **kwargs):
     """A simple wrapper for requests methods.
        url: the url of the http service;
        method: the http method;
        data: the JSON input when needed by the http method;
+       timeout: seconds, or a (connect, read) tuple; defaults to HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT;
+       retries: extra attempts after a connection error or a 502/503/504 reply (default none);
+       backoff: base delay for the retries, which wait a random time up to backoff * 2^attempt;
        return: the JSON reply content from the http service if the call succeeds;
             otherwise, return a JSON object with a "code" name-value pair.
     """
     code = 200
     result = {}
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
 
-    try:
-        if method.upper() in SUPPORTED_HTTP_METHODS:
-            r = requests.request(method, url, json = json, **kwargs)
-        else:
-            raise Exception("HTTP method {} unsupported.".format(method))
-    except Exception as e:
-        code = 500
-        result = {"code": code, "message": "invocation of service fails: " + url + ". " + str(e)}
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(random.uniform(0, backoff * 2 ** (attempt - 1)))
+        code = 200
+        try:
+            if method.upper() in SUPPORTED_HTTP_METHODS:
+                r = session.request(method, url, json = json, timeout = timeout, **kwargs)
+            else:
+                raise Exception("HTTP method {} unsupported.".format(method))
+        except requests.exceptions.RequestException as e:
+            code = 500
+            result = {"code": code, "message": "invocation of service fails: " + url + ". " + str(e)}
+            continue
+        except Exception as e:
+            code = 500
+            result = {"code": code, "message": "invocation of service fails: " + url + ". " + str(e)}
+            break
+        if r.status_code not in RETRY_STATUS_CODES:
+            break
     if code not in range(200,300):
         return result
 
@@ -35,4 +72,43 @@ def invoke_http(url, method='GET', json=None, **kwargs):
         code = 500
         result = {"code": code, "message": "Invalid JSON output from service: " + url + ". " + str(e)}
 
-    return result
\ No newline at end of file
+    return result
+
+def invoke_many(calls, deadline=None):
+    """Run independent invoke_http calls concurrently over the shared session.
+       calls: list of dicts of invoke_http arguments, e.g. {"url": ..., "method": "POST", "json": ...},
+            each optionally with its own "deadline" (seconds);
+       deadline: default deadline for calls without one (None: wait for the call's own timeouts);
+       return: the results in the order of calls, each as invoke_http would return it;
+            a call that misses its deadline gets {"code": 504, "message": ...}.
+    """
+    start = time.monotonic()
+    pending = []
+    for call in calls:
+        call = dict(call)
+        call_deadline = call.pop("deadline", deadline)
+        if call_deadline is not None:
+            call.setdefault("timeout", (min(HTTP_CONNECT_TIMEOUT, call_deadline), call_deadline))
+        pending.append((call["url"], call_deadline, fanout_executor.submit(invoke_http, **call)))
+
+    results = []
+    for url, call_deadline, future in pending:
+        remaining = None if call_deadline is None else max(0, start + call_deadline - time.monotonic())
+        try:
+            results.append(future.result(timeout=remaining))
+        except FutureTimeoutError:
+            future.cancel()
+            results.append({"code": 504, "message": "invocation of service timed out: " + url + "."})
+    return results
+
+def post_graphql(url, query, variables):
+    """POST a GraphQL query as a persisted query: only its sha256 hash is sent, plus the full
+       text when the service does not know the hash yet (then it is registered).
+       return: the requests Response; raises requests.exceptions.RequestException on failure.
+    """
+    timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(query.encode()).hexdigest()}}
+    response = session.post(url, json={'variables': variables, 'extensions': extensions}, timeout=timeout)
+    if response.ok and "PersistedQueryNotFound" in response.text:
+        response = session.post(url, json={'query': query, 'variables': variables, 'extensions': extensions}, timeout=timeout)
+    return response
@@ -4,7 +4,7 @@ import os, sys
 import requests
 import pika
 import json
-from invokes import invoke_http
+from invokes import invoke_http, post_graphql
 
 app = Flask(__name__)
 
@@ -97,7 +97,7 @@ def process_sell_ticket(ticket):
         }
         """
         variables = {"ticketID": ticket["ticketID"]}
-        response = requests.post(graphql_URL, json={'query': query, 'variables': variables})
+        response = post_graphql(graphql_URL, query, variables)
 
         # Check if response is valid
         if response.status_code != 200: